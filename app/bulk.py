@@ -0,0 +1,247 @@
+from typing import Any, Iterable, Iterator
+
+from sqlalchemy import delete, exists, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Component, ProdGroup, ProdVariant, ProdVariantComponent
+
+
+# Keeps a single multi-row statement well below Postgres' 32767 bind parameter limit
+BATCH_SIZE = 1000
+
+GROUP_FIELDS = ("group_nr", "title", "page_from", "page_to")
+VARIANT_FIELDS = ("group_id", "var_nr", "short_text", "long_text", "page_from", "page_to")
+
+
+def chunks(rows: list[Any], size: int = BATCH_SIZE) -> Iterator[list[Any]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+async def upsert_groups(session: AsyncSession, offer_id: int, rows: list[dict[str, Any]]) -> list[int]:
+    """Insert or update the groups of an offer on uq_group_per_offer.
+
+    Returns the group id for every row, in input order. Groups without a number
+    can't conflict and are matched by title against the offer's unnumbered groups.
+    """
+    keyed: dict[str, dict[str, Any]] = {}
+    unnumbered: dict[str, dict[str, Any]] = {}
+    for row in rows:
+        values = {field: row.get(field) for field in GROUP_FIELDS}
+        values["offer_id"] = offer_id
+        if values["group_nr"] is None:
+            unnumbered[values["title"]] = values
+        else:
+            keyed[values["group_nr"]] = values
+
+    by_nr: dict[str, int] = {}
+    for batch in chunks([keyed[k] for k in sorted(keyed)]):
+        stmt = pg_insert(ProdGroup).values(batch)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_group_per_offer",
+            set_={"title": stmt.excluded.title, "page_from": stmt.excluded.page_from, "page_to": stmt.excluded.page_to},
+        ).returning(ProdGroup.id, ProdGroup.group_nr)
+        for gid, group_nr in (await session.execute(stmt)).all():
+            by_nr[group_nr] = gid
+
+    by_title: dict[str, int] = {}
+    if unnumbered:
+        existing = await session.execute(
+            select(ProdGroup.id, ProdGroup.title).where(ProdGroup.offer_id == offer_id, ProdGroup.group_nr.is_(None))
+        )
+        for gid, title in existing.all():
+            by_title.setdefault(title, gid)
+        for title, values in unnumbered.items():
+            if title in by_title:
+                await session.execute(
+                    update(ProdGroup).where(ProdGroup.id == by_title[title]).values(page_from=values["page_from"], page_to=values["page_to"])
+                )
+        new = [values for title, values in unnumbered.items() if title not in by_title]
+        for batch in chunks(new):
+            result = await session.execute(pg_insert(ProdGroup).values(batch).returning(ProdGroup.id, ProdGroup.title))
+            for gid, title in result.all():
+                by_title[title] = gid
+
+    return [by_nr[row.get("group_nr")] if row.get("group_nr") is not None else by_title[row.get("title")] for row in rows]
+
+
+async def upsert_variants(session: AsyncSession, rows: Iterable[dict[str, Any]]) -> dict[tuple[int, str], int]:
+    """Insert or update variants on uq_variant_per_group in batches.
+
+    Returns {(group_id, var_nr): id} for every numbered variant. Later rows win
+    for duplicate keys, like a sequence of single-row upserts would. Variants
+    without a number never conflict and are inserted as new rows.
+    """
+    keyed: dict[tuple[int, str], dict[str, Any]] = {}
+    unnumbered: list[dict[str, Any]] = []
+    for row in rows:
+        values = {field: row.get(field) for field in VARIANT_FIELDS}
+        if values["var_nr"] is None:
+            unnumbered.append(values)
+        else:
+            keyed[(values["group_id"], values["var_nr"])] = values
+
+    ids: dict[tuple[int, str], int] = {}
+    # Sorted so concurrent writers lock rows in the same order
+    ordered = [keyed[k] for k in sorted(keyed)]
+    for batch in chunks(ordered):
+        stmt = pg_insert(ProdVariant).values(batch)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_variant_per_group",
+            set_={
+                "short_text": stmt.excluded.short_text,
+                "long_text": stmt.excluded.long_text,
+                "page_from": stmt.excluded.page_from,
+                "page_to": stmt.excluded.page_to,
+            },
+        ).returning(ProdVariant.id, ProdVariant.group_id, ProdVariant.var_nr)
+        for vid, group_id, var_nr in (await session.execute(stmt)).all():
+            ids[(group_id, var_nr)] = vid
+    for batch in chunks(unnumbered):
+        await session.execute(pg_insert(ProdVariant).values(batch))
+    return ids
+
+
+async def delete_unnumbered_variants(session: AsyncSession, group_ids: Iterable[int]) -> None:
+    """Variants without a number can't be matched on re-ingest, so they are replaced."""
+    await session.execute(delete(ProdVariant).where(ProdVariant.group_id.in_(sorted(set(group_ids))), ProdVariant.var_nr.is_(None)))
+
+
+async def delete_variants_except(session: AsyncSession, group_ids: Iterable[int], keep_ids: Iterable[int]) -> None:
+    """Delete numbered variants of the given groups that are not in keep_ids (no longer in the document)."""
+    stmt = delete(ProdVariant).where(ProdVariant.group_id.in_(sorted(set(group_ids))), ProdVariant.var_nr.is_not(None))
+    keep = sorted(set(keep_ids))
+    if keep:
+        stmt = stmt.where(ProdVariant.id.not_in(keep))
+    await session.execute(stmt)
+
+
+async def delete_groups(session: AsyncSession, group_ids: Iterable[int]) -> set[int]:
+    """Delete groups with their variants and links; returns the ids of the components they linked.
+
+    Links are deleted explicitly to collect the component ids; variants go with
+    their group through the FK cascade.
+    """
+    ids = sorted(set(group_ids))
+    if not ids:
+        return set()
+    variants = select(ProdVariant.id).where(ProdVariant.group_id.in_(ids))
+    links = await session.execute(
+        delete(ProdVariantComponent).where(ProdVariantComponent.prod_variant_id.in_(variants)).returning(ProdVariantComponent.component_id)
+    )
+    component_ids = set(links.scalars().all())
+    await session.execute(delete(ProdGroup).where(ProdGroup.id.in_(ids)))
+    return component_ids
+
+
+async def delete_orphan_components(session: AsyncSession, component_ids: Iterable[int]) -> int:
+    """Delete those of the given components that no variant links to. Returns the number deleted.
+
+    Components a concurrent ingest is linking right now are locked by it and skipped.
+    """
+    unused = ~exists().where(ProdVariantComponent.component_id == Component.id)
+    ids = sorted(set(component_ids))
+    locked = await session.execute(
+        select(Component.id).where(Component.id.in_(ids), unused).with_for_update(skip_locked=True)
+    )
+    locked_ids = locked.scalars().all()
+    if not locked_ids:
+        return 0
+    # Checked again under the lock: a link committed since the first check would
+    # otherwise be removed by the FK cascade along with its component
+    result = await session.execute(delete(Component).where(Component.id.in_(locked_ids), unused))
+    return result.rowcount
+
+
+def normalize_description(description: str) -> str:
+    """Dedupe key of a component: whitespace collapsed, case folded ("Schraube  M8" == "schraube m8")."""
+    return " ".join(description.split()).lower()
+
+
+async def get_or_create_components(session: AsyncSession, descriptions: Iterable[str]) -> dict[str, int]:
+    """Return {description: id}, inserting missing components on uq_component_description_norm.
+
+    Descriptions that normalize to the same key share one component; a new
+    component keeps the first spelling seen.
+    """
+    by_norm: dict[str, list[str]] = {}
+    for d in descriptions:
+        if d and d.strip():
+            by_norm.setdefault(normalize_description(d), []).append(d)
+    ids: dict[str, int] = {}
+    norm_ids: dict[str, int] = {}
+    for batch in chunks(sorted(by_norm)):
+        stmt = (
+            pg_insert(Component)
+            .values([{"description": by_norm[norm][0].strip(), "description_norm": norm} for norm in batch])
+            .on_conflict_do_nothing(index_elements=[Component.description_norm])
+            .returning(Component.id, Component.description_norm)
+        )
+        for cid, norm in (await session.execute(stmt)).all():
+            norm_ids[norm] = cid
+        missing = [norm for norm in batch if norm not in norm_ids]
+        if missing:
+            existing = await session.execute(select(Component.id, Component.description_norm).where(Component.description_norm.in_(missing)))
+            for cid, norm in existing.all():
+                norm_ids[norm] = cid
+    for norm, originals in by_norm.items():
+        if norm in norm_ids:
+            for d in originals:
+                ids[d] = norm_ids[norm]
+    return ids
+
+
+async def link_variant_components(session: AsyncSession, pairs: Iterable[tuple[int, int]]) -> int:
+    """Insert (prod_variant_id, component_id) links, skipping existing ones. Returns the number inserted."""
+    rows = [
+        {"prod_variant_id": variant_id, "component_id": component_id}
+        for variant_id, component_id in sorted(set(pairs))
+    ]
+    inserted = 0
+    for batch in chunks(rows):
+        stmt = (
+            pg_insert(ProdVariantComponent)
+            .values(batch)
+            .on_conflict_do_nothing(constraint="uq_variant_component")
+            .returning(ProdVariantComponent.id)
+        )
+        inserted += len((await session.execute(stmt)).all())
+    return inserted
+
+
+async def delete_links_except(session: AsyncSession, variant_ids: Iterable[int], keep_pairs: Iterable[tuple[int, int]]) -> None:
+    """Delete component links of the given variants except the (prod_variant_id, component_id) pairs in keep_pairs."""
+    variants = sorted(set(variant_ids))
+    if not variants:
+        return
+    stmt = delete(ProdVariantComponent).where(ProdVariantComponent.prod_variant_id.in_(variants))
+    keep = sorted(set(keep_pairs))
+    if keep:
+        stmt = stmt.where(tuple_(ProdVariantComponent.prod_variant_id, ProdVariantComponent.component_id).not_in(keep))
+    await session.execute(stmt)
+
+
+async def link_components_by_var_nr(session: AsyncSession, offer_id: int, pairs: Iterable[tuple[str, int]]) -> int:
+    """Link components to the variants of one offer by variant number, resolved in SQL.
+
+    pairs are (var_nr, component_id). Returns the number of links inserted.
+    """
+    rows = sorted(set(pairs))
+    inserted = 0
+    for batch in chunks(rows):
+        result = await session.execute(
+            text(
+                "INSERT INTO prod_variant_component (prod_variant_id, component_id) "
+                "SELECT DISTINCT pv.id, x.component_id "
+                "FROM unnest(CAST(:var_nrs AS varchar[]), CAST(:component_ids AS integer[])) AS x(var_nr, component_id) "
+                "JOIN prod_group g ON g.offer_id = :offer_id "
+                "JOIN prod_variant pv ON pv.group_id = g.id AND pv.var_nr = x.var_nr "
+                "ORDER BY 1, 2 "
+                "ON CONFLICT ON CONSTRAINT uq_variant_component DO NOTHING "
+                "RETURNING id"
+            ),
+            {"offer_id": offer_id, "var_nrs": [r[0] for r in batch], "component_ids": [r[1] for r in batch]},
+        )
+        inserted += len(result.all())
+    return inserted
@@ -1,8 +1,15 @@
+import logging
 import os
-from typing import AsyncIterator
-from sqlalchemy import text
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator
 
+from sqlalchemy import event, exc
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from .metrics import DB_POOL_TIMEOUTS, DB_POOL_WAIT_SECONDS, DB_STATEMENT_SECONDS, Gauge, current_stage, statement_kind
 
 
 def get_database_url() -> str:
@@ -17,25 +24,115 @@ def get_database_url() -> str:
     return f"postgresql+asyncpg://{user}:{password}@{host}:{port}/{db}"
 
 
-engine: AsyncEngine = create_async_engine(get_database_url(), echo=False, pool_pre_ping=True)
+@dataclass
+class PoolStats:
+    """Checkout counters of the connection pool, kept across engine.dispose()."""
+
+    checkouts: int = 0
+    timeouts: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    # Most recent checkout waits, for percentiles
+    recent: deque = field(default_factory=lambda: deque(maxlen=1000))
+
+    def record(self, wait: float) -> None:
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.recent.append(wait)
+
+    def percentile(self, pct: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited (including connecting and pre-ping)."""
+
+    def connect(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            wait = time.perf_counter() - start
+            pool_stats.record(wait)
+            DB_POOL_WAIT_SECONDS.observe(wait)
+
+
+# SQLAlchemy names the pool's logger after the subclass, outside the "sqlalchemy.pool" hierarchy, so it
+# would follow the app's log level. Checkouts are observable through /health/pool and /metrics instead.
+logging.getLogger(f"{TimedQueuePool.__module__}.{TimedQueuePool.__name__}").setLevel(os.getenv("DB_POOL_LOG_LEVEL", "WARNING").upper())
+
+
+def _engine_options() -> dict[str, Any]:
+    return {
+        "echo": False,
+        "echo_pool": False,
+        "pool_pre_ping": True,
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        # Prepared statements cached per connection by the asyncpg dialect; 0 disables (needed behind pgbouncer in transaction mode)
+        "connect_args": {"prepared_statement_cache_size": int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))},
+    }
+
+
+engine_options = _engine_options()
+engine: AsyncEngine = create_async_engine(get_database_url(), **engine_options)
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 
-async def get_db_session() -> AsyncIterator[AsyncSession]:
-    async with SessionLocal() as session:
-        yield session
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _statement_start(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._metrics_start = time.perf_counter()
+
 
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _statement_end(conn, cursor, statement, parameters, context, executemany) -> None:
+    DB_STATEMENT_SECONDS.observe(time.perf_counter() - context._metrics_start, stage=current_stage.get(), op=statement_kind(statement))
 
-async def ensure_schema() -> None:
-    """Lightweight migration to ensure new columns exist without Alembic.
 
-    Adds offer.pdf_filename if it doesn't exist.
-    """
-    async with engine.begin() as conn:
-        # Postgres: check if column exists
-        result = await conn.execute(
-            text("SELECT 1 FROM information_schema.columns WHERE table_name='offer' AND column_name='pdf_filename'")
-        )
-        if result.scalar() is None:
-            await conn.execute(text("ALTER TABLE offer ADD COLUMN pdf_filename varchar(255)"))
+def pool_status() -> dict[str, Any]:
+    """Current pool occupancy and checkout wait statistics (seconds)."""
+    pool = engine.pool
+    size = pool.size()
+    checked_out = pool.checkedout()
+    max_overflow = engine_options["max_overflow"]
+    return {
+        "size": size,
+        "max_overflow": max_overflow,
+        "checked_out": checked_out,
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "saturation": round(checked_out / max(1, size + max(0, max_overflow)), 3),
+        "timeout": pool.timeout(),
+        "checkouts": pool_stats.checkouts,
+        "timeouts": pool_stats.timeouts,
+        "wait_mean": round(pool_stats.wait_total / max(1, pool_stats.checkouts), 6),
+        "wait_p95": round(pool_stats.percentile(95), 6),
+        "wait_max": round(pool_stats.wait_max, 6),
+    }
 
+
+Gauge(
+    "lvflow_db_pool_connections",
+    "Connections of the DB pool by state",
+    lambda: {(state,): pool_status()[state] for state in ("checked_out", "idle", "overflow")},
+    ("state",),
+)
+
+
+async def get_db_session() -> AsyncIterator[AsyncSession]:
+    async with SessionLocal() as session:
+        yield session
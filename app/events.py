@@ -0,0 +1,90 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import asyncpg
+
+from .db import get_database_url
+
+logger = logging.getLogger("uvicorn.error")
+
+# Filled by the notify_ingest_job trigger (see app.migrations)
+JOB_CHANNEL = "ingest_job"
+
+
+class JobSubscription:
+    """Latest-state mailbox: rapid updates between two reads collapse into one."""
+
+    def __init__(self) -> None:
+        self.state: Optional[Dict[str, Any]] = None
+        self._changed = asyncio.Event()
+
+    def push(self, state: Dict[str, Any]) -> None:
+        self.state = state
+        self._changed.set()
+
+    async def wait(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Return the newest state, or None if nothing changed within timeout."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._changed.clear()
+        return self.state
+
+
+class JobEventHub:
+    """One LISTEN connection per process, fanned out to any number of subscribers."""
+
+    def __init__(self) -> None:
+        self._subs: Dict[str, set[JobSubscription]] = {}
+        self._conn: Optional[asyncpg.Connection] = None
+        self._lock = asyncio.Lock()
+
+    async def ensure_listening(self) -> None:
+        async with self._lock:
+            if self._conn is not None and not self._conn.is_closed():
+                return
+            dsn = get_database_url().replace("postgresql+asyncpg://", "postgresql://", 1)
+            conn = await asyncpg.connect(dsn)
+            await conn.add_listener(JOB_CHANNEL, self._on_notify)
+            conn.add_termination_listener(self._on_terminated)
+            self._conn = conn
+
+    def _on_terminated(self, conn: asyncpg.Connection) -> None:
+        logger.warning("Job event listener connection closed")
+        if self._conn is conn:
+            self._conn = None
+
+    def _on_notify(self, conn: asyncpg.Connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            state = json.loads(payload)
+        except ValueError:
+            return
+        for sub in self._subs.get(state.get("id"), ()):
+            sub.push(state)
+
+    @asynccontextmanager
+    async def subscribe(self, job_id: str) -> AsyncIterator[JobSubscription]:
+        await self.ensure_listening()
+        sub = JobSubscription()
+        self._subs.setdefault(job_id, set()).add(sub)
+        try:
+            yield sub
+        finally:
+            subs = self._subs.get(job_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[job_id]
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._conn is not None and not self._conn.is_closed():
+                await self._conn.close()
+            self._conn = None
+
+
+job_events = JobEventHub()
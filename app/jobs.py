@@ -1,59 +1,223 @@
 import asyncio
+import os
 import uuid
-from dataclasses import dataclass
 from typing import Any, Callable, Dict, Optional
 
+from sqlalchemy import text, update
 
-@dataclass
-class Job:
-    id: str
-    status: str = "pending"  # pending | running | completed | failed
-    progress: int = 0  # 0..100
-    stage: str = "init"
-    message: str = ""
-    result: Optional[Dict[str, Any]] = None
-    error: Optional[str] = None
+from .db import SessionLocal
+from .models import IngestJob
 
 
-_registry: Dict[str, Job] = {}
-_lock = asyncio.Lock()
+def get_lease_seconds() -> float:
+    return float(os.getenv("JOB_LEASE_SECONDS", "120"))
 
 
-async def create_job() -> Job:
-    job_id = str(uuid.uuid4())
-    job = Job(id=job_id)
-    async with _lock:
-        _registry[job_id] = job
+def get_max_attempts() -> int:
+    return max(1, int(os.getenv("JOB_MAX_ATTEMPTS", "3")))
+
+
+def get_max_queue_depth() -> int:
+    return int(os.getenv("JOB_MAX_QUEUE_DEPTH", "20"))
+
+
+class QueueFullError(RuntimeError):
+    """Too many jobs of a kind are waiting or running; retry after `retry_after` seconds."""
+
+    def __init__(self, kind: str, depth: int, retry_after: int) -> None:
+        super().__init__(f"{depth} {kind} jobs are queued, try again in {retry_after}s")
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+async def queue_depth(kind: str) -> int:
+    """Number of jobs of this kind that are pending or running."""
+    async with SessionLocal() as session:
+        result = await session.execute(
+            text("SELECT count(*) FROM ingest_job WHERE kind = :kind AND status IN ('pending', 'running')"),
+            {"kind": kind},
+        )
+        return result.scalar_one()
+
+
+async def check_admission(kind: str) -> None:
+    """Raise QueueFullError when JOB_MAX_QUEUE_DEPTH jobs of this kind are already queued (0 disables the limit).
+
+    The check is not atomic with the insert, so concurrent requests may overshoot the limit slightly.
+    """
+    max_depth = get_max_queue_depth()
+    if max_depth <= 0:
+        return
+    depth = await queue_depth(kind)
+    if depth >= max_depth:
+        raise QueueFullError(kind, depth, int(os.getenv("JOB_QUEUE_RETRY_AFTER_SECONDS", "30")))
+
+
+async def create_job(kind: str, payload: Dict[str, Any], priority: int = 0, max_attempts: Optional[int] = None) -> IngestJob:
+    job = IngestJob(
+        id=str(uuid.uuid4()),
+        kind=kind,
+        status="pending",
+        progress=0,
+        stage="init",
+        message="Queued",
+        payload=payload,
+        priority=priority,
+        attempts=0,
+        max_attempts=max_attempts or get_max_attempts(),
+    )
+    async with SessionLocal() as session:
+        session.add(job)
+        await session.commit()
     return job
 
 
-async def update_job(job_id: str, *, status: Optional[str] = None, progress: Optional[int] = None, stage: Optional[str] = None, message: Optional[str] = None, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
-    async with _lock:
-        job = _registry.get(job_id)
-        if not job:
-            return
-        if status is not None:
-            job.status = status
-        if progress is not None:
-            job.progress = max(0, min(100, progress))
-        if stage is not None:
-            job.stage = stage
-        if message is not None:
-            job.message = message
-        if result is not None:
-            job.result = result
-        if error is not None:
-            job.error = error
+async def update_job(job_id: str, *, status: Optional[str] = None, progress: Optional[int] = None, stage: Optional[str] = None, message: Optional[str] = None, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None, only_running: bool = False, worker_id: Optional[str] = None) -> bool:
+    """Update a job; with only_running or worker_id only while it is running or leased by that worker.
+
+    Returns False if no row matched.
+    """
+    values: Dict[str, Any] = {}
+    if status is not None:
+        values["status"] = status
+    if progress is not None:
+        values["progress"] = max(0, min(100, progress))
+    if stage is not None:
+        values["stage"] = stage
+    if message is not None:
+        values["message"] = message
+    if result is not None:
+        values["result"] = result
+    if error is not None:
+        values["error"] = error
+    if not values:
+        return False
+    stmt = update(IngestJob).where(IngestJob.id == job_id).values(updated_at=text("now()"), **values)
+    if only_running or worker_id is not None:
+        stmt = stmt.where(IngestJob.status == "running")
+    if worker_id is not None:
+        stmt = stmt.where(IngestJob.worker_id == worker_id)
+    async with SessionLocal() as session:
+        result = await session.execute(stmt)
+        await session.commit()
+        return result.rowcount > 0
 
 
-def get_job(job_id: str) -> Optional[Job]:
-    return _registry.get(job_id)
+async def get_job(job_id: str) -> Optional[IngestJob]:
+    async with SessionLocal() as session:
+        return await session.get(IngestJob, job_id)
 
 
-def progress_callback_factory(job_id: str) -> Callable[[str, int, str], None]:
+def progress_callback_factory(job_id: str, worker_id: str) -> Callable[[str, int, str], None]:
+    """Progress callback that writes at most one update per JOB_PROGRESS_FLUSH_SECONDS.
+
+    Rapid events are coalesced: only the latest stage/progress/message is written,
+    by a single flush task per job, and only while worker_id holds the job.
+    """
+    interval = float(os.getenv("JOB_PROGRESS_FLUSH_SECONDS", "0.25"))
+    latest: Dict[str, Any] = {}
+    flusher: Dict[str, Optional[asyncio.Task]] = {"task": None}
+
+    async def _flush() -> None:
+        try:
+            while latest:
+                values = dict(latest)
+                latest.clear()
+                # Scoped to the lease holder: neither a late update nor a worker that lost
+                # the lease can overwrite the state written by the job's current owner
+                await update_job(job_id, worker_id=worker_id, **values)
+                await asyncio.sleep(interval)
+        finally:
+            flusher["task"] = None
+
     def _cb(stage: str, pct: int, message: str) -> None:
-        # fire-and-forget; schedule update to avoid awaiting in compute path
-        asyncio.create_task(update_job(job_id, stage=stage, progress=pct, message=message, status="running"))
+        latest.update(stage=stage, progress=pct, message=message)
+        if flusher["task"] is None:
+            flusher["task"] = asyncio.create_task(_flush())
     return _cb
 
 
+async def claim_job(worker_id: str, kinds: list[str]) -> Optional[IngestJob]:
+    """Lease the next runnable job: pending and due, or running with an expired lease.
+
+    SKIP LOCKED lets any number of workers on any node poll the same table.
+    """
+    async with SessionLocal() as session:
+        result = await session.execute(
+            text(
+                "UPDATE ingest_job SET status = 'running', attempts = attempts + 1, worker_id = :worker_id, "
+                "lease_expires_at = now() + make_interval(secs => :lease), updated_at = now() "
+                "WHERE id = ("
+                "  SELECT id FROM ingest_job"
+                "  WHERE kind = ANY(:kinds) AND ("
+                "    (status = 'pending' AND run_after <= now())"
+                "    OR (status = 'running' AND lease_expires_at < now() AND attempts < max_attempts))"
+                "  ORDER BY priority DESC, created_at"
+                "  FOR UPDATE SKIP LOCKED LIMIT 1"
+                ") RETURNING id"
+            ),
+            {"worker_id": worker_id, "lease": get_lease_seconds(), "kinds": kinds},
+        )
+        job_id = result.scalar()
+        await session.commit()
+        if job_id is None:
+            return None
+        return await session.get(IngestJob, job_id)
+
+
+async def renew_lease(job_id: str, worker_id: str) -> bool:
+    """Extend the lease of a job this worker still owns. False means the lease was lost."""
+    async with SessionLocal() as session:
+        result = await session.execute(
+            text(
+                "UPDATE ingest_job SET lease_expires_at = now() + make_interval(secs => :lease) "
+                "WHERE id = :job_id AND worker_id = :worker_id AND status = 'running' RETURNING id"
+            ),
+            {"job_id": job_id, "worker_id": worker_id, "lease": get_lease_seconds()},
+        )
+        owned = result.scalar() is not None
+        await session.commit()
+        return owned
+
+
+async def complete_job(job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+    """Mark a job completed if worker_id still holds it. False means the lease was lost."""
+    return await update_job(job_id, worker_id=worker_id, status="completed", progress=100, stage="done", message="", result=result)
+
+
+async def fail_job(job_id: str, worker_id: str, error: str, retry_delay: float) -> Optional[str]:
+    """Put a failed attempt back in the queue after retry_delay, or fail it for good.
+
+    Returns the new status, "pending" (will be retried) or "failed", or None if
+    worker_id no longer holds the job.
+    """
+    async with SessionLocal() as session:
+        result = await session.execute(
+            text(
+                "UPDATE ingest_job SET "
+                "status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END, "
+                "stage = CASE WHEN attempts < max_attempts THEN 'retry' ELSE 'error' END, "
+                "run_after = now() + make_interval(secs => :delay), "
+                "lease_expires_at = NULL, error = :error, updated_at = now() "
+                "WHERE id = :job_id AND worker_id = :worker_id AND status = 'running' RETURNING status"
+            ),
+            {"job_id": job_id, "worker_id": worker_id, "error": error, "delay": retry_delay},
+        )
+        status = result.scalar()
+        await session.commit()
+        return status
+
+
+async def fail_expired_jobs() -> list[IngestJob]:
+    """Fail running jobs whose lease expired after their last allowed attempt; returns them."""
+    async with SessionLocal() as session:
+        result = await session.execute(
+            text(
+                "UPDATE ingest_job SET status = 'failed', stage = 'error', "
+                "error = COALESCE(error, 'Worker lease expired'), lease_expires_at = NULL, updated_at = now() "
+                "WHERE status = 'running' AND lease_expires_at < now() AND attempts >= max_attempts RETURNING id"
+            )
+        )
+        job_ids = result.scalars().all()
+        await session.commit()
+        return [job for job_id in job_ids if (job := await session.get(IngestJob, job_id)) is not None]
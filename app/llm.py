@@ -0,0 +1,288 @@
+"""Process-wide scheduler for LLM requests.
+
+All OpenAI calls of a process go through one `LLMScheduler`: a shared client
+(one connection pool), requests-per-minute and tokens-per-minute budgets,
+a cap on requests in flight, priority ordering (interactive before batch work)
+and retries with jittered exponential backoff that honour Retry-After.
+
+Set OPENAI_BASE_URL to point the client at a local stub server.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import httpx
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
+
+from .metrics import LLM_QUEUE_SECONDS, LLM_REQUEST_SECONDS, LLM_REQUESTS, LLM_TOKENS, Gauge
+
+logger = logging.getLogger("uvicorn.error")
+
+PRIORITY_BATCH = 0
+PRIORITY_INTERACTIVE = 10
+
+
+class LLMUnavailableError(RuntimeError):
+    """A request still failed after all retries."""
+
+
+class _TokenBucket:
+    """Budget of `per_minute` units, refilled continuously. The balance may go
+    negative when a request used more than it reserved; later requests wait it off."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        # A single request larger than the whole budget waits for a full bucket
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        if self.capacity > 0:
+            self._refill()
+            self.level -= amount
+
+
+@dataclass
+class SchedulerStats:
+    requests: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    failures: int = 0
+    tokens: int = 0
+    by_kind: dict[str, int] = field(default_factory=dict)
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count of a text (about 4 characters per token)."""
+    return len(text) // 4
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Rough token count of a prompt plus the reserved output budget."""
+    return count_tokens(prompt) + int(os.getenv("LLM_OUTPUT_TOKENS_ESTIMATE", "4000"))
+
+
+def _retry_after(exc: APIStatusError) -> Optional[float]:
+    headers = exc.response.headers if exc.response is not None else {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_concurrency: int,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+        timeout: float,
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.stats = SchedulerStats()
+        self._rpm = _TokenBucket(requests_per_minute)
+        self._tpm = _TokenBucket(tokens_per_minute)
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._queue: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond: Optional[asyncio.Condition] = None
+        self._client: Optional[AsyncOpenAI] = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise RuntimeError("OPENAI_API_KEY is not set")
+            # Retries are ours so they respect the shared budgets; OPENAI_BASE_URL is read by the client
+            self._client = AsyncOpenAI(
+                api_key=api_key,
+                max_retries=0,
+                timeout=self.timeout,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+                ),
+            )
+        return self._client
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def _admit(self, priority: int, tokens: int) -> None:
+        """Wait until this request is first in line, a slot is free and both budgets allow it."""
+        cond = self._condition()
+        entry = (-priority, next(self._seq))
+        async with cond:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    timeout: Optional[float] = None
+                    if self._queue[0] == entry and self._in_flight < self.max_concurrency:
+                        delay = max(self._paused_until - time.monotonic(), self._rpm.delay(1), self._tpm.delay(tokens))
+                        if delay <= 0:
+                            heapq.heappop(self._queue)
+                            self._rpm.take(1)
+                            self._tpm.take(tokens)
+                            self._in_flight += 1
+                            cond.notify_all()
+                            return
+                        timeout = delay
+                    try:
+                        await asyncio.wait_for(cond.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if entry in self._queue:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    cond.notify_all()
+                raise
+
+    async def _release(self, reserved: int, used: Optional[int]) -> None:
+        cond = self._condition()
+        async with cond:
+            self._in_flight -= 1
+            if used is not None:
+                # Settle the reservation against what the request actually cost
+                self._tpm.take(used - reserved)
+            cond.notify_all()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def complete(self, prompt: str, model: str, priority: int = PRIORITY_BATCH, kind: str = "llm") -> str:
+        """Run one prompt and return the output text, retrying transient failures."""
+        client = self.client
+        tokens = estimate_tokens(prompt)
+        self.stats.by_kind[kind] = self.stats.by_kind.get(kind, 0) + 1
+        attempt = 0
+        while True:
+            with LLM_QUEUE_SECONDS.time(kind=kind):
+                await self._admit(priority, tokens)
+            used: Optional[int] = None
+            start = time.perf_counter()
+            try:
+                self.stats.requests += 1
+                resp = await client.responses.create(model=model, input=prompt)
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, kind=kind)
+                LLM_REQUESTS.inc(kind=kind, outcome="ok")
+                if resp.usage is not None:
+                    used = resp.usage.total_tokens
+                    self.stats.tokens += used
+                    LLM_TOKENS.inc(used, kind=kind)
+                return resp.output_text
+            except (RateLimitError, InternalServerError, APITimeoutError, APIConnectionError) as e:
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, kind=kind)
+                if attempt >= self.max_retries:
+                    self.stats.failures += 1
+                    LLM_REQUESTS.inc(kind=kind, outcome="failed")
+                    raise LLMUnavailableError(f"{kind} request failed after {attempt + 1} attempts: {e}") from e
+                delay = self._backoff(attempt)
+                if isinstance(e, APIStatusError):
+                    retry_after = _retry_after(e)
+                    if retry_after is not None:
+                        delay = max(delay, retry_after)
+                if isinstance(e, RateLimitError):
+                    # The quota is shared, so everybody waits, not just this request
+                    self.stats.rate_limited += 1
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                attempt += 1
+                self.stats.retries += 1
+                LLM_REQUESTS.inc(kind=kind, outcome="retry")
+                logger.warning(f"LLM {kind} request failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            except Exception:
+                # Not retryable (bad request, auth, ...)
+                self.stats.failures += 1
+                LLM_REQUESTS.inc(kind=kind, outcome="failed")
+                raise
+            finally:
+                await self._release(tokens, used)
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        self._cond = None
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Return the process-wide scheduler, configured from the environment."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler(
+            requests_per_minute=float(os.getenv("LLM_RPM", "500")),
+            tokens_per_minute=float(os.getenv("LLM_TPM", "500000")),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "6")),
+            backoff_base=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1")),
+            backoff_max=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60")),
+            timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "600")),
+        )
+    return _scheduler
+
+
+Gauge(
+    "lvflow_llm_requests",
+    "LLM requests in flight or waiting for admission",
+    lambda: {("in_flight",): _scheduler.in_flight, ("queued",): _scheduler.queued} if _scheduler else {},
+    ("state",),
+)
+
+
+async def close_llm_scheduler() -> None:
+    if _scheduler is not None:
+        await _scheduler.aclose()
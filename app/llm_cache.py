@@ -0,0 +1,123 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+
+class LLMCache:
+    """Content-addressed store for LLM responses, backed by a local SQLite file.
+
+    Entries are keyed by sha256(model, prompt). Eviction drops entries older than
+    max_age_seconds and then the least recently used ones until the total
+    response size fits into max_bytes.
+    """
+
+    def __init__(self, path: Path, max_age_seconds: float, max_bytes: int, evict_every: int = 50) -> None:
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.evict_every = max(1, evict_every)
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_response ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used_at REAL NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_response_last_used ON llm_response (last_used_at)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model: str, prompt: str) -> str:
+        h = hashlib.sha256()
+        h.update(model.encode("utf-8"))
+        h.update(b"\x00")
+        h.update(prompt.encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM llm_response WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.stats.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_response SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_response (key, model, response, size, created_at, last_used_at, hits)"
+                " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, model, response, len(response.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+            self.stats.stores += 1
+            due = self.stats.stores % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then LRU entries until under the size budget."""
+        cutoff = time.time() - self.max_age_seconds
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM llm_response WHERE created_at < ?", (cutoff,)).rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_response").fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                freed = 0
+                victims: list[str] = []
+                for key, size in self._conn.execute("SELECT key, size FROM llm_response ORDER BY last_used_at"):
+                    victims.append(key)
+                    freed += size
+                    if freed >= excess:
+                        break
+                self._conn.executemany("DELETE FROM llm_response WHERE key = ?", [(k,) for k in victims])
+                removed += len(victims)
+            self._conn.commit()
+            self.stats.evictions += removed
+        return removed
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Return the process-wide cache, or None if disabled via LLM_CACHE_ENABLED=0."""
+    global _cache
+    if os.getenv("LLM_CACHE_ENABLED", "1") in ("0", "false", "False"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(
+                path=Path(os.getenv("LLM_CACHE_PATH", "data/cache/llm_responses.sqlite3")),
+                max_age_seconds=float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30")) * 86400,
+                max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024),
+            )
+        return _cache
@@ -1,24 +1,66 @@
-from fastapi import FastAPI
+import asyncio
+import os
+import time
+
+from fastapi import FastAPI, Request
 from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi.staticfiles import StaticFiles
 from .routers.health import router as health_router
 from .routers.ingest import router as ingest_router
+from .routers.metrics import router as metrics_router
+from .routers.search import router as search_router
 from .routers.web import router as web_router
-from .db import ensure_schema
+from .migrations import run_migrations
+from .utils.pdf import shutdown_pdf_pool
+from .worker import Worker
+from .events import job_events
+from .llm import close_llm_scheduler
+from .metrics import HTTP_REQUEST_SECONDS
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await ensure_schema()
+    await run_migrations()
+    worker = worker_task = None
+    if os.getenv("JOB_EMBEDDED_WORKER", "1") not in ("0", "false", "False"):
+        # Convenience for single-process setups; run `python -m app.worker` for dedicated workers
+        worker = Worker()
+        worker_task = asyncio.create_task(worker.run())
     yield
+    if worker and worker_task:
+        worker.stop()
+        await worker_task
+    await job_events.close()
+    await close_llm_scheduler()
+    shutdown_pdf_pool()
 
 
 def create_app() -> FastAPI:
     app = FastAPI(title="LVFlow MVP", version="0.1.0", lifespan=lifespan)
 
+    @app.middleware("http")
+    async def record_request_latency(request: Request, call_next):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Label by route template (/offers/{offer_id}), not the raw path, to keep the series bounded
+            route = request.scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=request.method,
+                route=getattr(route, "path", "unmatched"),
+                status=str(status),
+            )
+
     app.include_router(health_router)
+    app.include_router(metrics_router)
     app.include_router(ingest_router, prefix="/ingest", tags=["ingest"])
+    app.include_router(search_router, prefix="/search", tags=["search"])
     app.include_router(web_router)
 
     # Static (if you add files under app/static)
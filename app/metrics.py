@@ -0,0 +1,181 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are registered at import time and rendered by
+`render()` for GET /metrics (and the worker's METRICS_PORT). Values live in
+the process, so every API and worker process is a separate scrape target.
+
+`current_stage` labels DB statements with the ingest stage that issued them;
+it is set by `stage_context` and inherited by tasks started inside it.
+"""
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional
+
+# Seconds; covers both DB statements and multi-minute LLM calls and ingest stages
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+current_stage: ContextVar[str] = ContextVar("metrics_stage", default="")
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        _registry.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> Iterator[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: per-bucket counts (not cumulative), sum, count
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        counts, total = self._values.setdefault(key, ([0] * len(self.buckets), [0.0, 0]))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        total[0] += value
+        total[1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> Iterator[str]:
+        for key, (counts, (total, count)) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {int(count)}"
+
+
+class Gauge(_Metric):
+    """Value read at scrape time from `fn`, which returns {label values: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], dict[tuple[str, ...], float]], labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def _samples(self) -> Iterator[str]:
+        for key, value in sorted(self.fn().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+def render() -> str:
+    return "\n".join(m.render() for m in _registry) + "\n"
+
+
+@contextmanager
+def stage_context(stage: str) -> Iterator[None]:
+    """Label DB statements issued inside the block with `stage`."""
+    token = current_stage.set(stage)
+    try:
+        yield
+    finally:
+        current_stage.reset(token)
+
+
+@contextmanager
+def ingest_stage(stage: str) -> Iterator[None]:
+    """Time a step of ingest_from_pdf into INGEST_STAGE_SECONDS and label its DB statements."""
+    with stage_context(stage), INGEST_STAGE_SECONDS.time(stage=stage):
+        yield
+
+
+def statement_kind(statement: Optional[str]) -> str:
+    """SELECT, INSERT, UPDATE, DELETE or OTHER, from the first keyword of a statement (after a CTE)."""
+    words = (statement or "").lstrip().split(None, 1)
+    first = words[0].upper() if words else ""
+    if first == "WITH":
+        upper = statement.upper()
+        positions = {kind: upper.find(kind) for kind in ("INSERT", "UPDATE", "DELETE")}
+        found = [(pos, kind) for kind, pos in positions.items() if pos >= 0]
+        return min(found)[1] if found else "SELECT"
+    return first if first in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+# Ingestion
+INGEST_STAGE_SECONDS = Histogram("lvflow_ingest_stage_seconds", "Duration of ingest_from_pdf steps (per call, or per group/batch for pipeline stages)", ("stage",))
+INGEST_GROUPS = Counter("lvflow_ingest_groups_total", "Groups processed by ingest_from_pdf by outcome", ("outcome",))
+PDF_PAGES = Counter("lvflow_pdf_pages_total", "Pages extracted from PDFs with pdfplumber")
+PDF_EXTRACT_SECONDS = Histogram("lvflow_pdf_extract_seconds", "Wall time of pdfplumber text extraction per document")
+
+# LLM
+LLM_REQUEST_SECONDS = Histogram("lvflow_llm_request_seconds", "Latency of LLM requests by prompt kind (per attempt)", ("kind",))
+LLM_QUEUE_SECONDS = Histogram("lvflow_llm_queue_seconds", "Time LLM requests waited for admission by the scheduler", ("kind",))
+LLM_REQUESTS = Counter("lvflow_llm_requests_total", "LLM request attempts by prompt kind and outcome (ok, retry, failed)", ("kind", "outcome"))
+LLM_TOKENS = Counter("lvflow_llm_tokens_total", "Tokens used by LLM requests by prompt kind", ("kind",))
+
+# Database
+DB_STATEMENT_SECONDS = Histogram("lvflow_db_statement_seconds", "Duration of DB statements by ingest stage (empty outside ingestion) and statement kind", ("stage", "op"))
+DB_POOL_WAIT_SECONDS = Histogram("lvflow_db_pool_wait_seconds", "Time spent checking out a pooled connection (including connecting)")
+DB_POOL_TIMEOUTS = Counter("lvflow_db_pool_timeouts_total", "Pool checkouts that timed out")
+
+# HTTP
+HTTP_REQUEST_SECONDS = Histogram("lvflow_http_request_seconds", "HTTP request latency until the response starts, by route template", ("method", "route", "status"))
@@ -0,0 +1,197 @@
+"""Versioned schema migrations.
+
+Every migration runs once per database, in version order, inside the same
+transaction as its row in schema_migrations. Processes starting at the same
+time (API replicas, workers) serialize on an advisory lock, so each migration is
+applied exactly once. Add changes as a new entry at the end of MIGRATIONS and
+never edit one that has shipped. The baseline builds a fresh database from the
+current models, so later migrations must be idempotent (IF NOT EXISTS).
+
+Migrations run at API startup; `python -m app.migrations` applies them (or
+lists their state with --list) without starting the app.
+"""
+import asyncio
+import logging
+import sys
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .bulk import normalize_description
+from .db import engine
+from .models import VARIANT_SEARCH_VECTOR, Base
+
+logger = logging.getLogger("uvicorn.error")
+
+# Arbitrary application-wide key for pg_advisory_xact_lock
+MIGRATION_LOCK_KEY = 7_221_841_305
+
+async def _table_exists(conn, table: str) -> bool:
+    result = await conn.execute(text("SELECT 1 FROM information_schema.tables WHERE table_name=:table"), {"table": table})
+    return result.scalar() is not None
+
+
+async def _add_column_if_missing(conn, table: str, column: str, ddl: str) -> None:
+    if not await _table_exists(conn, table):
+        return
+    result = await conn.execute(
+        text("SELECT 1 FROM information_schema.columns WHERE table_name=:table AND column_name=:column"),
+        {"table": table, "column": column},
+    )
+    if result.scalar() is None:
+        await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+async def _ensure_component_description_norm(conn) -> None:
+    """Backfill component.description_norm, merge components that normalize alike and make it unique."""
+    if not await _table_exists(conn, "component"):
+        return
+    await _add_column_if_missing(conn, "component", "description_norm", "varchar")
+    rows = (await conn.execute(text("SELECT id, description FROM component WHERE description_norm IS NULL"))).all()
+    if rows:
+        await conn.execute(
+            text("UPDATE component SET description_norm = :norm WHERE id = :id"),
+            [{"id": cid, "norm": normalize_description(description)} for cid, description in rows],
+        )
+    dupes = "WITH d AS (SELECT id, min(id) OVER (PARTITION BY description_norm) AS keep FROM component)"
+    # Re-point links to the surviving component; deleting the duplicates cascades their old links.
+    # Duplicates are the same part spelled differently, so a variant linked to several of them
+    # needs all those quantities: counts are added up (a missing count counts as 1, as on the detail page).
+    await conn.execute(text(
+        f"{dupes} INSERT INTO prod_variant_component (prod_variant_id, component_id, count) "
+        "SELECT l.prod_variant_id, d.keep, CASE WHEN count(*) = 1 THEN max(l.count) ELSE sum(COALESCE(l.count, 1)) END "
+        "FROM prod_variant_component l JOIN d ON d.id = l.component_id "
+        "WHERE d.id <> d.keep GROUP BY l.prod_variant_id, d.keep "
+        "ON CONFLICT ON CONSTRAINT uq_variant_component "
+        "DO UPDATE SET count = COALESCE(prod_variant_component.count, 1) + COALESCE(EXCLUDED.count, 1)"
+    ))
+    await conn.execute(text(f"{dupes} DELETE FROM component c USING d WHERE c.id = d.id AND d.id <> d.keep"))
+    await conn.execute(text("ALTER TABLE component ALTER COLUMN description_norm SET NOT NULL"))
+    await conn.execute(text("ALTER TABLE component DROP CONSTRAINT IF EXISTS uq_component_description"))
+    await conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_component_description_norm ON component (description_norm)"))
+
+
+async def _ensure_search_indexes(conn) -> None:
+    """Full-text index on variants and, if pg_trgm can be installed, a trigram index on components."""
+    if await _table_exists(conn, "prod_variant"):
+        await _add_column_if_missing(conn, "prod_variant", "search_vector", f"tsvector GENERATED ALWAYS AS ({VARIANT_SEARCH_VECTOR}) STORED")
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_prod_variant_search ON prod_variant USING gin (search_vector)"))
+    if not await _table_exists(conn, "component"):
+        return
+    try:
+        # A savepoint keeps the migration going where the extension is not available or not permitted
+        async with conn.begin_nested():
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        logger.warning(f"pg_trgm unavailable, component search falls back to an unindexed substring match ({getattr(e, 'orig', e)})")
+        return
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_component_description_trgm ON component USING gin (description_norm gin_trgm_ops)"))
+
+
+# Publishes job state changes on the ingest_job channel for app.events
+_JOB_NOTIFY_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION notify_ingest_job() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('ingest_job', json_build_object(
+            'id', NEW.id, 'status', NEW.status, 'progress', NEW.progress,
+            'stage', NEW.stage, 'message', left(NEW.message, 1000)
+        )::text);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER ingest_job_notify
+    AFTER INSERT OR UPDATE OF status, progress, stage, message ON ingest_job
+    FOR EACH ROW EXECUTE FUNCTION notify_ingest_job()
+    """,
+]
+
+
+async def _0001_baseline(conn: AsyncConnection) -> None:
+    """Schema as maintained by the former ensure_schema: every step is idempotent,
+    so databases created by any earlier version converge to the same state."""
+    await conn.run_sync(Base.metadata.create_all)
+    for ddl in _JOB_NOTIFY_DDL:
+        await conn.exec_driver_sql(ddl)
+    await _add_column_if_missing(conn, "offer", "pdf_filename", "varchar(255)")
+    await _add_column_if_missing(conn, "offer", "pdf_sha256", "varchar(64)")
+    await _add_column_if_missing(conn, "prod_group", "text_sha256", "varchar(64)")
+    await _ensure_component_description_norm(conn)
+    await _ensure_search_indexes(conn)
+
+
+async def _0002_fk_and_lookup_indexes(conn: AsyncConnection) -> None:
+    # prod_group.offer_id, prod_variant.group_id and prod_variant_component.prod_variant_id
+    # are the leading columns of their unique constraints and already indexed
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_prod_variant_component_component_id ON prod_variant_component (component_id)"))
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_offer_doc_name ON offer (doc_name)"))
+
+
+Migration = tuple[int, str, Callable[[AsyncConnection], Awaitable[None]]]
+
+MIGRATIONS: list[Migration] = [
+    (1, "baseline", _0001_baseline),
+    (2, "fk_and_lookup_indexes", _0002_fk_and_lookup_indexes),
+]
+
+
+async def _applied_versions(conn: AsyncConnection) -> set[int]:
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version integer PRIMARY KEY, name varchar(255) NOT NULL, applied_at timestamptz NOT NULL DEFAULT now())"
+    ))
+    return set((await conn.execute(text("SELECT version FROM schema_migrations"))).scalars().all())
+
+
+async def run_migrations() -> list[int]:
+    """Apply pending migrations and return their versions."""
+    applied: list[int] = []
+    async with engine.connect() as conn:
+        async with conn.begin():
+            # Held until the end of this transaction; the other processes wait here and then find nothing to do
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            done = await _applied_versions(conn)
+        for version, name, migrate in MIGRATIONS:
+            if version in done:
+                continue
+            async with conn.begin():
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+                # Another process may have applied it while we were waiting for the lock
+                if version in await _applied_versions(conn):
+                    continue
+                logger.info(f"Applying migration {version:04d}_{name}")
+                await migrate(conn)
+                await conn.execute(text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"), {"version": version, "name": name})
+            applied.append(version)
+    return applied
+
+
+async def _print_status() -> None:
+    async with engine.connect() as conn:
+        async with conn.begin():
+            done = await _applied_versions(conn)
+    for version, name, _ in MIGRATIONS:
+        print(f"{version:04d}_{name}: {'applied' if version in done else 'pending'}")
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+
+    async def _main() -> None:
+        try:
+            if "--list" in sys.argv[1:]:
+                await _print_status()
+            else:
+                applied = await run_migrations()
+                print(f"Applied {len(applied)} migration(s)" + (f": {applied}" if applied else ""))
+        finally:
+            await engine.dispose()
+
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()
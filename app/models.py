@@ -1,6 +1,8 @@
-from typing import Optional
+from datetime import datetime
+from typing import Any, Optional
 
-from sqlalchemy import ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy import Computed, DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint, func
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlalchemy.orm import Mapped, declarative_base, mapped_column, relationship
 
 
@@ -9,16 +11,20 @@ Base = declarative_base()
 
 class Offer(Base):
     __tablename__ = "offer"
+    __table_args__ = (Index("ix_offer_doc_name", "doc_name"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     doc_name: Mapped[str] = mapped_column(String(255), nullable=False)
     pdf_filename: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    pdf_sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
 
-    groups: Mapped[list["ProdGroup"]] = relationship(back_populates="offer", cascade="all, delete-orphan")
+    # passive_deletes: children are removed by the ON DELETE CASCADE foreign keys, not loaded and deleted one by one
+    groups: Mapped[list["ProdGroup"]] = relationship(back_populates="offer", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class ProdGroup(Base):
     __tablename__ = "prod_group"
+    # Also serves as the index on the offer_id foreign key
     __table_args__ = (UniqueConstraint("offer_id", "group_nr", name="uq_group_per_offer"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -26,15 +32,24 @@ class ProdGroup(Base):
     title: Mapped[str] = mapped_column(String(255), nullable=False)
     page_from: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     page_to: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # sha256 of the group's extraction input, set once the group is fully ingested
+    text_sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
     offer_id: Mapped[int] = mapped_column(ForeignKey("offer.id", ondelete="CASCADE"), nullable=False)
 
     offer: Mapped[Offer] = relationship(back_populates="groups")
-    variants: Mapped[list["ProdVariant"]] = relationship(back_populates="group", cascade="all, delete-orphan")
+    variants: Mapped[list["ProdVariant"]] = relationship(back_populates="group", cascade="all, delete-orphan", passive_deletes=True)
+
+
+VARIANT_SEARCH_VECTOR = "to_tsvector('german', coalesce(var_nr, '') || ' ' || short_text || ' ' || coalesce(long_text, ''))"
 
 
 class ProdVariant(Base):
     __tablename__ = "prod_variant"
-    __table_args__ = (UniqueConstraint("group_id", "var_nr", name="uq_variant_per_group"),)
+    __table_args__ = (
+        # Also serves as the index on the group_id foreign key
+        UniqueConstraint("group_id", "var_nr", name="uq_variant_per_group"),
+        Index("ix_prod_variant_search", "search_vector", postgresql_using="gin"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     var_nr: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
@@ -44,23 +59,33 @@ class ProdVariant(Base):
     page_from: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     page_to: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     group_id: Mapped[int] = mapped_column(ForeignKey("prod_group.id", ondelete="CASCADE"), nullable=False)
+    search_vector: Mapped[Any] = mapped_column(TSVECTOR, Computed(VARIANT_SEARCH_VECTOR, persisted=True), deferred=True)
 
     group: Mapped[ProdGroup] = relationship(back_populates="variants")
-    components: Mapped[list["ProdVariantComponent"]] = relationship(back_populates="variant", cascade="all, delete-orphan")
+    components: Mapped[list["ProdVariantComponent"]] = relationship(back_populates="variant", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Component(Base):
     __tablename__ = "component"
+    # Trigram index on description_norm (needs pg_trgm) is created by the migrations when the extension is available
+    __table_args__ = (Index("uq_component_description_norm", "description_norm", unique=True),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     description: Mapped[str] = mapped_column(String, nullable=False)
+    # Dedupe key, see bulk.normalize_description
+    description_norm: Mapped[str] = mapped_column(String, nullable=False)
 
-    variants: Mapped[list["ProdVariantComponent"]] = relationship(back_populates="component", cascade="all, delete-orphan")
+    variants: Mapped[list["ProdVariantComponent"]] = relationship(back_populates="component", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class ProdVariantComponent(Base):
     __tablename__ = "prod_variant_component"
-    __table_args__ = (UniqueConstraint("prod_variant_id", "component_id", name="uq_variant_component"),)
+    # prod_variant_id is covered by the unique constraint; component_id needs its own index
+    # for component deletes (FK cascade) and "where is this component used" lookups
+    __table_args__ = (
+        UniqueConstraint("prod_variant_id", "component_id", name="uq_variant_component"),
+        Index("ix_prod_variant_component_component_id", "component_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     prod_variant_id: Mapped[int] = mapped_column(ForeignKey("prod_variant.id", ondelete="CASCADE"), nullable=False)
@@ -70,3 +95,26 @@ class ProdVariantComponent(Base):
     variant: Mapped[ProdVariant] = relationship(back_populates="components")
     component: Mapped[Component] = relationship(back_populates="variants")
 
+
+
+class IngestJob(Base):
+    __tablename__ = "ingest_job"
+    __table_args__ = (Index("ix_ingest_job_claim", "status", "run_after"),)
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending")  # pending | running | completed | failed
+    progress: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # 0..100
+    stage: Mapped[str] = mapped_column(String(64), nullable=False, default="init")
+    message: Mapped[str] = mapped_column(Text, nullable=False, default="")
+    payload: Mapped[dict[str, Any]] = mapped_column(JSONB, nullable=False, default=dict)
+    result: Mapped[Optional[dict[str, Any]]] = mapped_column(JSONB, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=3)
+    worker_id: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    run_after: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
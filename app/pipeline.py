@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from .metrics import Histogram, stage_context
+
+logger = logging.getLogger("uvicorn.error")
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """One step of a pipeline.
+
+    `fn` maps an item to the item handed to the next stage (None drops it). With
+    batch=True, `fn` receives a list of every item waiting in the input queue (up
+    to max_batch) and returns a list, so e.g. DB writes of several items share one
+    transaction. A batch that raises is retried one item at a time, so only the
+    items that fail on their own are reported.
+    """
+
+    name: str
+    fn: Callable[[Any], Awaitable[Any]]
+    workers: int = 1
+    batch: bool = False
+    max_batch: int = 64
+
+
+async def run_pipeline(
+    items: Iterable[Any],
+    stages: list[Stage],
+    on_error: Optional[Callable[[str, Any, BaseException], None]] = None,
+    queue_size: Optional[int] = None,
+    timings: Optional[Histogram] = None,
+) -> list[Any]:
+    """Push items through stages connected by bounded queues and return the output of the last stage.
+
+    Every stage runs its own workers, so a slow stage (an LLM call) overlaps with
+    the others (DB writes, CPU work) across items. A bounded queue blocks the
+    stage in front of it instead of buffering the whole input. An exception raised
+    for an item is passed to on_error and the item is dropped; the others go on.
+    With `timings`, every call of a stage function is observed with stage=<name>.
+    """
+    queues = [asyncio.Queue(maxsize=queue_size or 2 * max(1, s.workers)) for s in stages]
+    results: list[Any] = []
+
+    async def _forward(i: int, out: Any) -> None:
+        if out is None:
+            return
+        if i + 1 < len(stages):
+            await queues[i + 1].put(out)
+        else:
+            results.append(out)
+
+    async def _call(stage: Stage, batch: list[Any]) -> list[Any]:
+        with stage_context(stage.name):
+            return await stage.fn(batch) if stage.batch else [await stage.fn(batch[0])]
+
+    def _fail(stage: Stage, item: Any, exc: BaseException) -> None:
+        if on_error:
+            on_error(stage.name, item, exc)
+        else:
+            logger.error(f"Pipeline stage {stage.name} failed", exc_info=exc)
+
+    async def _worker(i: int, stage: Stage) -> None:
+        inq = queues[i]
+        done = False
+        while not done:
+            item = await inq.get()
+            if item is _DONE:
+                break
+            batch = [item]
+            if stage.batch:
+                # Take whatever else is already waiting, without waiting for more
+                while len(batch) < stage.max_batch and not inq.empty():
+                    nxt = inq.get_nowait()
+                    if nxt is _DONE:
+                        done = True
+                        break
+                    batch.append(nxt)
+            start = time.perf_counter()
+            try:
+                outs = await _call(stage, batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    _fail(stage, item, e)
+                    continue
+                # One bad item must not take the rest of the batch down with it
+                logger.warning(f"Pipeline stage {stage.name} failed for a batch of {len(batch)}, retrying one at a time: {e!r}")
+                outs = []
+                for it in batch:
+                    try:
+                        outs.extend(await _call(stage, [it]))
+                    except Exception as item_exc:
+                        _fail(stage, it, item_exc)
+            finally:
+                if timings is not None:
+                    timings.observe(time.perf_counter() - start, stage=stage.name)
+            for out in outs:
+                await _forward(i, out)
+
+    async def _run_stage(i: int, stage: Stage) -> None:
+        workers = max(1, stage.workers)
+        await asyncio.gather(*(_worker(i, stage) for _ in range(workers)))
+        # Close the next stage once everything of this one has been forwarded
+        if i + 1 < len(stages):
+            for _ in range(max(1, stages[i + 1].workers)):
+                await queues[i + 1].put(_DONE)
+
+    async def _feed() -> None:
+        for item in items:
+            await queues[0].put(item)
+        for _ in range(max(1, stages[0].workers)):
+            await queues[0].put(_DONE)
+
+    tasks = [asyncio.create_task(_feed())] + [asyncio.create_task(_run_stage(i, s)) for i, s in enumerate(stages)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return results
@@ -0,0 +1,110 @@
+"""Readiness checks behind GET /health/ready.
+
+The probe measures the database round trip through the engine, pool
+saturation, the ingest job backlog and whether the LLM backend answers.
+Results are cached for READY_CACHE_SECONDS and concurrent probes share one
+evaluation, so a load balancer polling every instance adds next to no load.
+The LLM check is off by default; when enabled it has its own, longer cache
+(READY_LLM_CACHE_SECONDS), since it calls an external, metered API.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Optional
+
+import httpx
+from sqlalchemy import text
+
+from .db import engine, pool_status
+from .jobs import queue_depth
+
+_cached: Optional[tuple[float, dict[str, Any]]] = None
+_llm_cached: Optional[tuple[float, dict[str, Any]]] = None
+_lock: Optional[asyncio.Lock] = None
+
+
+def _check(ok: bool, value: Any, limit: Any, required: bool = True, error: Optional[str] = None) -> dict[str, Any]:
+    result = {"ok": ok, "value": value, "limit": limit, "required": required}
+    if error:
+        result["error"] = error
+    return result
+
+
+async def _check_db(timeout: float) -> dict[str, Any]:
+    limit_ms = float(os.getenv("READY_DB_MAX_LATENCY_MS", "500"))
+    start = time.perf_counter()
+    try:
+        async def _ping() -> None:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        await asyncio.wait_for(_ping(), timeout)
+    except Exception as e:
+        return _check(False, None, limit_ms, error=type(e).__name__)
+    latency_ms = round((time.perf_counter() - start) * 1000, 1)
+    return _check(latency_ms <= limit_ms, latency_ms, limit_ms)
+
+
+def _check_pool() -> dict[str, Any]:
+    limit = float(os.getenv("READY_POOL_MAX_SATURATION", "0.9"))
+    saturation = pool_status()["saturation"]
+    return _check(saturation <= limit, saturation, limit)
+
+
+async def _check_queue(timeout: float) -> dict[str, Any]:
+    limit = int(os.getenv("READY_MAX_QUEUE_DEPTH", "100"))
+    try:
+        depth = await asyncio.wait_for(queue_depth("ingest_pdf"), timeout)
+    except Exception as e:
+        return _check(False, None, limit, error=type(e).__name__)
+    return _check(limit <= 0 or depth <= limit, depth, limit)
+
+
+async def _check_llm(timeout: float) -> dict[str, Any]:
+    # Any HTTP answer below 500 means the backend is reachable; auth is not checked
+    required = os.getenv("READY_LLM_REQUIRED", "0") == "1"
+    base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+    start = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            resp = await client.get(f"{base_url}/models", headers={"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"})
+    except httpx.HTTPError as e:
+        return _check(False, None, timeout * 1000, required=required, error=type(e).__name__)
+    latency_ms = round((time.perf_counter() - start) * 1000, 1)
+    return _check(resp.status_code < 500, latency_ms, timeout * 1000, required=required, error=None if resp.status_code < 500 else f"HTTP {resp.status_code}")
+
+
+async def _cached_check_llm(timeout: float) -> dict[str, Any]:
+    global _llm_cached
+    ttl = float(os.getenv("READY_LLM_CACHE_SECONDS", "60"))
+    now = time.monotonic()
+    if _llm_cached is None or now - _llm_cached[0] > ttl:
+        _llm_cached = (now, await _check_llm(timeout))
+    return _llm_cached[1]
+
+
+async def _evaluate() -> dict[str, Any]:
+    timeout = float(os.getenv("READY_CHECK_TIMEOUT_SECONDS", "2"))
+    probes = {"db": _check_db(timeout), "queue": _check_queue(timeout)}
+    if os.getenv("READY_CHECK_LLM", "0") == "1":
+        probes["llm"] = _cached_check_llm(timeout)
+    checks: dict[str, Any] = {"pool": _check_pool()}
+    checks.update(zip(probes, await asyncio.gather(*probes.values())))
+    failed_required = [name for name, c in checks.items() if not c["ok"] and c["required"]]
+    failed_optional = [name for name, c in checks.items() if not c["ok"] and not c["required"]]
+    status = "unavailable" if failed_required else ("degraded" if failed_optional else "ok")
+    return {"status": status, "checks": checks}
+
+
+async def readiness() -> dict[str, Any]:
+    """Cached readiness report: status "ok", "degraded" (an optional check failed) or "unavailable"."""
+    global _cached, _lock
+    ttl = float(os.getenv("READY_CACHE_SECONDS", "2"))
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        now = time.monotonic()
+        if _cached is None or now - _cached[0] > ttl:
+            _cached = (now, await _evaluate())
+        report = dict(_cached[1])
+        report["age"] = round(now - _cached[0], 3)
+        return report
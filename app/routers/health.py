@@ -1,14 +1,25 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from ..db import pool_status
+from ..readiness import readiness
 
 router = APIRouter(prefix="/health", tags=["health"])
 
 
 @router.get("/ready", summary="Readiness probe")
-def ready() -> dict:
-    return {"status": "ok"}
+async def ready() -> JSONResponse:
+    report = await readiness()
+    # 503 takes the instance out of rotation until the failing checks recover
+    return JSONResponse(report, status_code=503 if report["status"] == "unavailable" else 200)
 
 
 @router.get("/live", summary="Liveness probe")
 def live() -> dict:
     return {"status": "alive"}
 
+
+
+@router.get("/pool", summary="Database connection pool usage")
+def pool() -> dict:
+    return pool_status()
@@ -3,9 +3,11 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import get_db_session, SessionLocal
-from ..services import init_db, ingest_from_json, ingest_from_pdf
-from ..jobs import create_job, update_job, progress_callback_factory
+from ..db import get_db_session
+from ..services import init_db, ingest_from_json
+from ..jobs import QueueFullError
+from ..llm import PRIORITY_BATCH
+from ..uploads import submit_pdf_ingest
 
 
 router = APIRouter()
@@ -34,22 +36,10 @@ async def ingest_from_json_route(
 async def ingest_from_pdf_route(
     offer_name: str = Form(...),
     file: UploadFile = File(...),
-    session: AsyncSession = Depends(get_db_session),
 ) -> JSONResponse:
-    job = await create_job()
-    pdf_bytes = await file.read()
-    progress_cb = progress_callback_factory(job.id)
-
-    async def _run() -> None:
-        try:
-            await update_job(job.id, status="running", stage="start", progress=1, message="Starting")
-            # Use a fresh DB session not tied to the request lifecycle
-            async with SessionLocal() as bg_session:
-                inserted = await ingest_from_pdf(bg_session, offer_name=offer_name, pdf_bytes=pdf_bytes, progress_cb=progress_cb)
-            await update_job(job.id, status="completed", progress=100, stage="done", result={"inserted": inserted})
-        except Exception as e:
-            await update_job(job.id, status="failed", stage="error", error=str(e))
-
-    import asyncio
-    asyncio.create_task(_run())
-    return JSONResponse({"job_id": job.id})
\ No newline at end of file
+    # API uploads are batch work; only the web form runs ahead as interactive
+    try:
+        job = await submit_pdf_ingest(file, offer_name, PRIORITY_BATCH)
+    except QueueFullError as e:
+        return JSONResponse({"detail": str(e)}, status_code=429, headers={"Retry-After": str(e.retry_after)})
+    return JSONResponse({"job_id": job.id})
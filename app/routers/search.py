@@ -0,0 +1,61 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db import get_db_session
+from ..search import search_components, search_variants
+
+
+router = APIRouter()
+
+
+class ComponentHit(BaseModel):
+    id: int
+    description: str
+    score: float
+
+
+class VariantHit(BaseModel):
+    id: int
+    var_nr: Optional[str]
+    short_text: str
+    group_id: int
+    group_nr: Optional[str]
+    group_title: str
+    offer_id: int
+    offer_name: str
+    score: float
+    snippet: str
+
+
+class SearchResponse(BaseModel):
+    query: str
+    page: int
+    per_page: int
+    components: list[ComponentHit] = []
+    variants: list[VariantHit] = []
+    has_more: bool = False
+
+
+@router.get("", response_model=SearchResponse, summary="Ranked search over components and variants")
+async def search(
+    q: str = Query(..., min_length=2, max_length=200),
+    kind: Literal["all", "components", "variants"] = "all",
+    offer_id: Optional[int] = None,
+    page: int = Query(1, ge=1),
+    per_page: int = Query(20, ge=1, le=100),
+    session: AsyncSession = Depends(get_db_session),
+) -> SearchResponse:
+    offset = (page - 1) * per_page
+    response = SearchResponse(query=q, page=page, per_page=per_page)
+    if kind in ("all", "components"):
+        rows = await search_components(session, q, offer_id=offer_id, limit=per_page, offset=offset)
+        response.has_more |= len(rows) > per_page
+        response.components = [ComponentHit(**r) for r in rows[:per_page]]
+    if kind in ("all", "variants"):
+        rows = await search_variants(session, q, offer_id=offer_id, limit=per_page, offset=offset)
+        response.has_more |= len(rows) > per_page
+        response.variants = [VariantHit(**r) for r in rows[:per_page]]
+    return response
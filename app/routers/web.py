@@ -1,13 +1,29 @@
+import os
+from types import SimpleNamespace
+from typing import Optional
+
 from fastapi import APIRouter, Depends, File, Form, Request, UploadFile
 from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
 from ..db import get_db_session
-from ..services import ingest_from_json, ingest_from_pdf, export_offer_to_excel
-from ..models import Offer, ProdGroup, ProdVariant, ProdVariantComponent, Component
-from ..jobs import get_job
+from ..services import (
+    count_offer_variants,
+    delete_offer,
+    get_offer_delete_sync_max_variants,
+    get_offers_page_size,
+    ingest_from_json,
+    list_offers,
+    load_offer_detail,
+    stream_offer_csv,
+    stream_offer_excel,
+)
+from ..models import Offer
+from ..jobs import QueueFullError, create_job, get_job
+from ..events import job_events
+from ..llm import PRIORITY_INTERACTIVE
+from ..uploads import submit_pdf_ingest
 
 
 router = APIRouter()
@@ -37,20 +53,33 @@ async def upload_view(
     request: Request,
     offer_name: str = Form(...),
     file: UploadFile = File(...),
-    session: AsyncSession = Depends(get_db_session),
 ) -> HTMLResponse:
-    pdf_bytes = await file.read()
-    inserted = await ingest_from_pdf(session, offer_name=offer_name, pdf_bytes=pdf_bytes)
-    return templates.TemplateResponse(
-        "partials/ingest_result.html",
-        {"request": request, "inserted": inserted},
-    )
+    # Runs as a job like /ingest/from-pdf; the request returns as soon as the upload is staged
+    try:
+        job = await submit_pdf_ingest(file, offer_name, PRIORITY_INTERACTIVE)
+    except QueueFullError as e:
+        return templates.TemplateResponse(
+            "partials/queue_full.html",
+            {"request": request, "error": e},
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    return templates.TemplateResponse("partials/job_status.html", {"request": request, "job": job})
 
 
 @router.get("/offers", response_class=HTMLResponse)
-async def offers_list(request: Request, session: AsyncSession = Depends(get_db_session)) -> HTMLResponse:
-    offers = (await session.execute(select(Offer).order_by(Offer.id.desc()))).scalars().all()
-    return templates.TemplateResponse("offers/list.html", {"request": request, "offers": offers})
+async def offers_list(
+    request: Request,
+    before: Optional[int] = None,
+    q: str = "",
+    session: AsyncSession = Depends(get_db_session),
+) -> HTMLResponse:
+    offers, cursor = await list_offers(session, before_id=before, name=q or None, limit=get_offers_page_size())
+    context = {"request": request, "offers": offers, "cursor": cursor, "before": before, "q": q}
+    # HTMX requests (next page on scroll, name filter) only need the rows
+    if request.headers.get("HX-Request"):
+        return templates.TemplateResponse("partials/offer_rows.html", context)
+    return templates.TemplateResponse("offers/list.html", context)
 
 
 @router.get("/offers/{offer_id}", response_class=HTMLResponse)
@@ -59,62 +88,90 @@ async def offer_detail(offer_id: int, request: Request, session: AsyncSession =
     if not offer:
         return templates.TemplateResponse("offers/detail.html", {"request": request, "offer": None, "groups": [], "matrix": {}})
 
-    groups = (await session.execute(select(ProdGroup).where(ProdGroup.offer_id == offer_id).order_by(ProdGroup.group_nr))).scalars().all()
-
-    # Build variant-component matrix per group
-    detail = []
-    for g in groups:
-        variants = (await session.execute(select(ProdVariant).where(ProdVariant.group_id == g.id).order_by(ProdVariant.var_nr))).scalars().all()
-        # collect components used by these variants
-        var_ids = [v.id for v in variants]
-        links = (await session.execute(select(ProdVariantComponent).where(ProdVariantComponent.prod_variant_id.in_(var_ids)))).scalars().all()
-        comp_ids = sorted({lnk.component_id for lnk in links})
-        components = []
-        if comp_ids:
-            components = (await session.execute(select(Component).where(Component.id.in_(comp_ids)).order_by(Component.id))).scalars().all()
-        # matrix counts
-        counts: dict[tuple[int, int], int] = {}
-        for lnk in links:
-            key = (lnk.prod_variant_id, lnk.component_id)
-            counts[key] = (counts.get(key) or 0) + (lnk.count or 1)
-        detail.append({
-            "group": g,
-            "variants": variants,
-            "components": components,
-            "counts": counts,
-        })
-
+    detail = await load_offer_detail(session, offer_id)
     return templates.TemplateResponse("offers/detail.html", {"request": request, "offer": offer, "detail": detail})
 
 
 @router.get("/ingest/jobs/{job_id}", response_class=HTMLResponse)
 async def job_status_partial(job_id: str, request: Request) -> HTMLResponse:
-    job = get_job(job_id)
+    job = await get_job(job_id)
     if not job:
         return HTMLResponse("", status_code=404)
     return templates.TemplateResponse("partials/job_status.html", {"request": request, "job": job})
 
 
+def _sse(event: str, html: str) -> bytes:
+    data = "\n".join(f"data: {line}" for line in html.splitlines() or [""])
+    return f"event: {event}\n{data}\n\n".encode("utf-8")
+
+
+@router.get("/ingest/jobs/{job_id}/events")
+async def job_status_events(job_id: str, request: Request):
+    """Server-Sent Events stream of a job's status, pushed from the job table's NOTIFY channel."""
+    job = await get_job(job_id)
+    if not job:
+        return HTMLResponse("", status_code=404)
+    keepalive = float(os.getenv("JOB_EVENTS_KEEPALIVE_SECONDS", "15"))
+    body = templates.get_template("partials/job_status_body.html")
+    final = templates.get_template("partials/job_status.html")
+
+    async def _stream():
+        async with job_events.subscribe(job_id) as sub:
+            state = job
+            while True:
+                if state.status in ("completed", "failed"):
+                    # Notifications carry no result; render the final state from the row
+                    yield _sse("done", final.render(job=await get_job(job_id) or state))
+                    return
+                yield _sse("status", body.render(job=state))
+                new_state = None
+                while new_state is None:
+                    if await request.is_disconnected():
+                        return
+                    new_state = await sub.wait(keepalive)
+                    if new_state is None:
+                        # Quiet period: re-check the row in case a notification was missed
+                        await job_events.ensure_listening()
+                        current = await get_job(job_id)
+                        if current and (current.status, current.progress, current.stage, current.message) != (state.status, state.progress, state.stage, state.message):
+                            new_state = current
+                        else:
+                            yield b": keepalive\n\n"
+                state = SimpleNamespace(**new_state) if isinstance(new_state, dict) else new_state
+
+    return StreamingResponse(_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @router.get("/offers/{offer_id}/export.xlsx")
-async def export_offer_excel(offer_id: int, session: AsyncSession = Depends(get_db_session)):
-    data = await export_offer_to_excel(offer_id, session)
+async def export_offer_excel(offer_id: int):
     return StreamingResponse(
-        _iter_bytes(data),
+        stream_offer_excel(offer_id),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={"Content-Disposition": f"attachment; filename=offer_{offer_id}.xlsx"},
     )
 
 
-def _iter_bytes(data: bytes):
-    yield data
+@router.get("/offers/{offer_id}/export.csv")
+async def export_offer_csv(offer_id: int):
+    return StreamingResponse(
+        stream_offer_csv(offer_id),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f"attachment; filename=offer_{offer_id}.csv"},
+    )
 
 
 @router.delete("/offers/{offer_id}", response_class=HTMLResponse)
 async def offer_delete(offer_id: int, request: Request, session: AsyncSession = Depends(get_db_session)) -> HTMLResponse:
     offer = await session.get(Offer, offer_id)
-    if offer:
-        await session.delete(offer)
-        await session.commit()
+    if not offer:
+        return HTMLResponse(content="")
+    if await count_offer_variants(session, offer_id) > get_offer_delete_sync_max_variants():
+        # Large offers are deleted by a worker; the row shows the job's progress meanwhile
+        job = await create_job("delete_offer", {"offer_id": offer_id}, priority=PRIORITY_INTERACTIVE)
+        return templates.TemplateResponse("partials/offer_deleting.html", {"request": request, "offer": offer, "job": job})
+    # delete_offer runs its own transactions; don't hold this connection meanwhile
+    await session.close()
+    await delete_offer(offer_id)
     # For HTMX: return empty content and swap out the target li
     return HTMLResponse(content="")
 
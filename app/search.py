@@ -0,0 +1,117 @@
+import os
+from typing import Any, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .bulk import normalize_description
+
+# Result of the pg_trgm check, looked up once per process
+_trigram_available: Optional[bool] = None
+
+
+async def _has_trigram(session: AsyncSession) -> bool:
+    global _trigram_available
+    if _trigram_available is None:
+        result = await session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+        _trigram_available = result.scalar() is not None
+    return _trigram_available
+
+
+def get_search_max_candidates() -> int:
+    return int(os.getenv("SEARCH_MAX_CANDIDATES", "5000"))
+
+
+def like_pattern(query: str) -> str:
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+async def search_components(session: AsyncSession, query: str, offer_id: Optional[int] = None, limit: int = 20, offset: int = 0) -> list[dict[str, Any]]:
+    """Components whose description contains or resembles the query, best matches first.
+
+    Matching runs on description_norm, so case and whitespace don't matter. With
+    pg_trgm, typos still match (word similarity) and the trigram index serves the
+    substring match as well. Returns up to limit + 1 rows so callers can tell if
+    there is a next page.
+    """
+    norm = normalize_description(query)
+    params: dict[str, Any] = {"norm": norm, "pattern": like_pattern(norm), "limit": limit + 1, "offset": offset}
+    scope = ""
+    if offer_id is not None:
+        scope = (
+            " AND EXISTS (SELECT 1 FROM prod_variant_component l"
+            " JOIN prod_variant v ON v.id = l.prod_variant_id"
+            " JOIN prod_group g ON g.id = v.group_id"
+            " WHERE l.component_id = c.id AND g.offer_id = :offer_id)"
+        )
+        params["offer_id"] = offer_id
+    if await _has_trigram(session):
+        match = "(c.description_norm LIKE :pattern OR :norm <% c.description_norm)"
+        score = "word_similarity(:norm, c.description_norm)"
+    else:
+        match = "c.description_norm LIKE :pattern"
+        score = "CASE WHEN c.description_norm LIKE :prefix THEN 1.0 ELSE 0.5 END"
+        params["prefix"] = like_pattern(norm)[1:]
+    result = await session.execute(
+        text(
+            f"SELECT c.id, c.description, {score} AS score FROM component c "
+            f"WHERE {match}{scope} "
+            "ORDER BY score DESC, length(c.description_norm), c.id "
+            "LIMIT :limit OFFSET :offset"
+        ),
+        params,
+    )
+    return [{"id": cid, "description": description, "score": round(float(score), 4)} for cid, description, score in result.all()]
+
+
+async def search_variants(session: AsyncSession, query: str, offer_id: Optional[int] = None, limit: int = 20, offset: int = 0) -> list[dict[str, Any]]:
+    """Variants matching the query in number, short text or long text, ranked by ts_rank_cd.
+
+    The query uses web search syntax ("quoted phrases", -exclusions, or) with
+    German stemming. Ranking reads the tsvector of every match, so very broad
+    queries rank only the first SEARCH_MAX_CANDIDATES matches; narrow the query
+    or filter by offer for exhaustive results. Returns up to limit + 1 rows, see
+    search_components.
+    """
+    params: dict[str, Any] = {"query": query, "limit": limit + 1, "offset": offset, "candidates": get_search_max_candidates()}
+    scope = ""
+    if offer_id is not None:
+        scope = " AND g.offer_id = :offer_id"
+        params["offer_id"] = offer_id
+    # Matches come from the GIN index; only the first `candidates` of them are ranked,
+    # and the headline is only built for the returned page
+    result = await session.execute(
+        text(
+            "WITH q AS (SELECT websearch_to_tsquery('german', :query) AS tsq), "
+            "matches AS ("
+            "  SELECT v.id, v.search_vector FROM prod_variant v JOIN prod_group g ON g.id = v.group_id CROSS JOIN q"
+            f"  WHERE v.search_vector @@ q.tsq{scope} LIMIT :candidates"
+            "), "
+            "hits AS ("
+            "  SELECT m.id, ts_rank_cd(m.search_vector, q.tsq) AS score FROM matches m CROSS JOIN q"
+            "  ORDER BY score DESC, m.id LIMIT :limit OFFSET :offset"
+            ") "
+            "SELECT v.id, v.var_nr, v.short_text, g.id, g.group_nr, g.title, o.id, o.doc_name, hits.score, "
+            "ts_headline('german', coalesce(v.long_text, ''), q.tsq, 'MaxFragments=2, MaxWords=20, MinWords=5') "
+            "FROM hits JOIN prod_variant v ON v.id = hits.id JOIN prod_group g ON g.id = v.group_id "
+            "JOIN offer o ON o.id = g.offer_id, q "
+            "ORDER BY hits.score DESC, v.id"
+        ),
+        params,
+    )
+    return [
+        {
+            "id": vid,
+            "var_nr": var_nr,
+            "short_text": short_text,
+            "group_id": group_id,
+            "group_nr": group_nr,
+            "group_title": group_title,
+            "offer_id": offer_id_,
+            "offer_name": doc_name,
+            "score": round(float(score), 4),
+            "snippet": snippet,
+        }
+        for vid, var_nr, short_text, group_id, group_nr, group_title, offer_id_, doc_name, score, snippet in result.all()
+    ]
@@ -1,118 +1,176 @@
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterator, Iterable, Iterator, Optional
+import csv
+import hashlib
+import io
 import logging
 import os
-import io
 import json
+import time
 import dotenv
 import asyncio
 
-import pdfplumber
-from openai import AsyncOpenAI
-import io as _io
-import pandas as pd
-
-from sqlalchemy import select
+from sqlalchemy import Select, delete, func, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .models import Base, Component, Offer, ProdGroup, ProdVariant, ProdVariantComponent
 from .db import SessionLocal
-
-from .utils.extraction import get_group_extraction_prompt, get_variant_extraction_prompt, get_required_components_prompt
+from .migrations import run_migrations
+from .llm import PRIORITY_BATCH, count_tokens, get_llm_scheduler
+from .llm_cache import get_llm_cache
+from .bulk import (
+    BATCH_SIZE,
+    chunks,
+    delete_groups,
+    delete_links_except,
+    delete_orphan_components,
+    delete_unnumbered_variants,
+    delete_variants_except,
+    get_or_create_components,
+    link_components_by_var_nr,
+    link_variant_components,
+    upsert_groups,
+    upsert_variants,
+)
+from .pipeline import Stage, run_pipeline
+from .search import like_pattern
+
+from .utils.xlsx import StreamingXlsxWriter
+from .utils.jsonstream import find_records_file, iter_records
+from .utils.extraction import (
+    get_group_extraction_prompt,
+    get_required_components_prompt,
+    get_variant_extraction_prompt,
+    merge_groups,
+    split_page_windows,
+)
+from .text_store import get_document_text
+from .uploads import file_sha256, keep_upload
+from .metrics import INGEST_GROUPS, INGEST_STAGE_SECONDS, ingest_stage
 
 dotenv.load_dotenv()
 
 logger = logging.getLogger("uvicorn.error")
 
+LLM_MODEL = "gpt-5"
+
+
+def _safe_json(text: str) -> dict[str, Any]:
+    try:
+        return json.loads(text)
+    except Exception:
+        start = text.find("{")
+        end = text.rfind("}")
+        if start != -1 and end != -1 and end > start:
+            return json.loads(text[start:end + 1])
+        raise
+
+
+async def _llm_json(prompt: str, model: str = LLM_MODEL, priority: int = PRIORITY_BATCH, kind: str = "llm") -> dict[str, Any]:
+    """Run a prompt through the shared LLM scheduler and parse the JSON answer, using the response cache.
+
+    Only responses that parse are cached, so a malformed answer is retried next time.
+    """
+    cache = get_llm_cache()
+    key = cache.make_key(model, prompt) if cache else None
+    if cache:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            return _safe_json(cached)
+    output_text = await get_llm_scheduler().complete(prompt, model=model, priority=priority, kind=kind)
+    payload = _safe_json(output_text)
+    if cache:
+        await asyncio.to_thread(cache.put, key, model, output_text)
+    return payload
+
+
 async def init_db(session: AsyncSession) -> None:
     async with session.bind.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    await run_migrations()
 
 
-async def ingest_from_json(session: AsyncSession, offer_name: str, base_dir: str = "data") -> dict[str, int]:
-    import json
+async def ingest_from_json(session: AsyncSession, offer_name: str, base_dir: str = "data", batch_size: int = BATCH_SIZE) -> dict[str, int]:
+    """Import product_groups, product_variants and required_components from base_dir.
 
+    Each file may be a JSON document ({"groups": [...]} etc.) or NDJSON with one
+    record per line (.ndjson/.jsonl, preferred when both exist). Records are
+    streamed and written in batches of batch_size, so memory stays bounded by the
+    batch size and the group-number map rather than the file size.
+    """
     base_path = Path(base_dir)
-    groups_json: dict[str, Any] = json.loads((base_path / "product_groups.json").read_text())
-    variants_json: dict[str, Any] = json.loads((base_path / "product_variants.json").read_text())
-    required_components_path = base_path / "required_components.json"
-    required_components_json: dict[str, Any] | None = None
-    if required_components_path.exists():
-        required_components_json = json.loads(required_components_path.read_text())
+    groups_path = find_records_file(base_path, "product_groups")
+    variants_path = find_records_file(base_path, "product_variants")
+    if groups_path is None or variants_path is None:
+        raise FileNotFoundError(f"product_groups and product_variants files are required in {base_path}")
+    required_components_path = find_records_file(base_path, "required_components")
 
     offer = Offer(doc_name=offer_name)
     session.add(offer)
     await session.flush()
 
+    # Groups: one multi-row INSERT ... RETURNING per batch
     group_no_to_id: dict[str, int] = {}
-    for g in groups_json.get("groups", []):
-        group = ProdGroup(
-            group_nr=g.get("group_no"),
-            title=g["title"],
-            page_from=g.get("page_from"),
-            page_to=g.get("page_to"),
-            offer_id=offer.id,
-        )
-        session.add(group)
-        await session.flush()
-        if g.get("group_no"):
-            group_no_to_id[g["group_no"]] = group.id
-
+    first_group_id: int | None = None
+    for batch in _batched(iter_records(groups_path, "groups"), batch_size):
+        group_rows = [
+            {
+                "group_nr": g.get("group_no"),
+                "title": g["title"],
+                "page_from": g.get("page_from"),
+                "page_to": g.get("page_to"),
+                "offer_id": offer.id,
+            }
+            for g in batch
+        ]
+        result = await session.execute(insert(ProdGroup).values(group_rows).returning(ProdGroup.id, ProdGroup.group_nr))
+        for gid, group_nr in result.all():
+            first_group_id = gid if first_group_id is None else min(first_group_id, gid)
+            if group_nr:
+                group_no_to_id[group_nr] = gid
+
+    # Variants: resolve the group in memory, then upsert batch by batch
     inserted_variants = 0
-    for v in variants_json.get("variants", []):
-        var_nr = v.get("variant_no")
-        short_text = v.get("title") or ""
-        long_text = v.get("text")
-        page_from = v.get("page_from")
-        page_to = v.get("page_to")
-
-        group_nr = None
-        if isinstance(var_nr, str) and "." in var_nr:
-            group_nr = ".".join(var_nr.split(".")[:2])
-        result_group_id = group_no_to_id.get(group_nr)
-        if not result_group_id:
-            first_group_id = await session.scalar(select(ProdGroup.id).where(ProdGroup.offer_id == offer.id).limit(1))
-            result_group_id = int(first_group_id or 0)
-
-        variant = ProdVariant(
-            var_nr=var_nr,
-            short_text=short_text,
-            long_text=long_text,
-            page_from=page_from,
-            page_to=page_to,
-            group_id=result_group_id,
-        )
-        session.add(variant)
-        inserted_variants += 1
-
-    await session.flush()
-
-    inserted_components = 0
+    for batch in _batched(iter_records(variants_path, "variants"), batch_size):
+        variant_rows: list[dict[str, Any]] = []
+        for v in batch:
+            var_nr = v.get("variant_no")
+            group_nr = None
+            if isinstance(var_nr, str) and "." in var_nr:
+                group_nr = ".".join(var_nr.split(".")[:2])
+            result_group_id = group_no_to_id.get(group_nr) or first_group_id
+            if result_group_id is None:
+                raise ValueError("product_groups contains no groups to attach variants to")
+            variant_rows.append({
+                "group_id": result_group_id,
+                "var_nr": var_nr,
+                "short_text": v.get("title") or "",
+                "long_text": v.get("text"),
+                "page_from": v.get("page_from"),
+                "page_to": v.get("page_to"),
+            })
+        await upsert_variants(session, variant_rows)
+        inserted_variants += len(variant_rows)
+
+    # Components: links are resolved in SQL against the variants of this offer only
+    component_ids_seen: set[int] = set()
     inserted_links = 0
-    if required_components_json:
-        desc_to_component_id: dict[str, int] = {}
-        for c in required_components_json.get("components", []):
-            description = c["component_description"].strip()
-            comp_id = desc_to_component_id.get(description)
-            if not comp_id:
-                comp = Component(description=description)
-                session.add(comp)
-                await session.flush()
-                desc_to_component_id[description] = comp.id
-                inserted_components += 1
-
-            variant_nos = c.get("variant_nos", [])
-            if not variant_nos:
-                continue
-            result = await session.execute(select(ProdVariant).where(ProdVariant.var_nr.in_(variant_nos)))
-            variants = result.scalars().all()
-            for v in variants:
-                link = ProdVariantComponent(
-                    prod_variant_id=v.id,
-                    component_id=desc_to_component_id[description],
-                )
-                session.add(link)
-                inserted_links += 1
+    if required_components_path is not None:
+        for batch in _batched(iter_records(required_components_path, "components"), batch_size):
+            comp_variant_nos: dict[str, list[str]] = {}
+            for c in batch:
+                description = c["component_description"].strip()
+                comp_variant_nos.setdefault(description, []).extend(c.get("variant_nos", []))
+            component_ids = await get_or_create_components(session, comp_variant_nos)
+            component_ids_seen.update(component_ids.values())
+            pairs = [
+                (vno, component_ids[description])
+                for description, vnos in comp_variant_nos.items()
+                if description in component_ids
+                for vno in vnos
+            ]
+            inserted_links += await link_components_by_var_nr(session, offer.id, pairs)
 
     await session.commit()
 
@@ -120,85 +178,122 @@ async def ingest_from_json(session: AsyncSession, offer_name: str, base_dir: str
         "offers": 1,
         "groups": len(group_no_to_id) or 0,
         "variants": inserted_variants,
-        "components": inserted_components,
+        "components": len(component_ids_seen),
         "variant_components": inserted_links,
     }
 
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    batch: list[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def get_group_extraction_max_tokens() -> int:
+    return int(os.getenv("GROUP_EXTRACTION_MAX_TOKENS", "30000"))
+
+
+async def _extract_groups(texts: list[str], priority: int = PRIORITY_BATCH) -> list[dict[str, Any]]:
+    """Extract product groups from page texts.
+
+    Documents that fit into GROUP_EXTRACTION_MAX_TOKENS go into a single prompt.
+    Longer ones are split into page windows that are extracted concurrently and
+    merged by group number and page range.
+    """
+    prompt_tokens = count_tokens(get_group_extraction_prompt(""))
+    budget = max(1000, get_group_extraction_max_tokens() - prompt_tokens)
+    windows = split_page_windows(texts, budget, count_tokens)
+    if len(windows) <= 1:
+        payload = await _llm_json(get_group_extraction_prompt("\n".join(texts)), priority=priority, kind="groups")
+        return payload.get("groups", [])
+    logger.info(f"Extracting groups from {len(windows)} page windows")
+    payloads = await asyncio.gather(*(
+        _llm_json(get_group_extraction_prompt("\n".join(window)), priority=priority, kind="groups")
+        for window in windows
+    ))
+    return merge_groups([payload.get("groups", []) for payload in payloads])
+
+
+def _group_fingerprint(w: "_GroupWork") -> str:
+    """Hash of everything the LLM sees for a group: model, number, title and sliced text."""
+    h = hashlib.sha256()
+    for part in (LLM_MODEL, w.group_nr or "", w.title, w.text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+@dataclass
+class _GroupWork:
+    """A product group travelling through the ingestion pipeline."""
+
+    group_id: int
+    group_nr: str | None
+    title: str
+    page_from: int | None
+    page_to: int | None
+    text: str = ""
+    text_sha256: str | None = None
+    variants: list[dict[str, Any]] = field(default_factory=list)
+    variant_ids: dict[str, int] = field(default_factory=dict)
+    components: dict[str, list[str]] = field(default_factory=dict)
+    component_count: int = 0
+    link_count: int = 0
+
+
 async def ingest_from_pdf(
     session: AsyncSession,
     offer_name: str,
-    pdf_bytes: bytes,
+    pdf_path: Path,
+    pdf_sha256: Optional[str] = None,
     progress_cb=None,
-    num_concurrent_groups: int = 4,
-) -> dict[str, int]:
+    num_concurrent_groups: int | None = None,
+    priority: int = PRIORITY_BATCH,
+) -> dict[str, Any]:
     """Extract structure from a PDF and persist via existing JSON ingestion.
 
     Steps (MVP):
-      1) Save uploaded PDF to data/uploads for traceability
-      2) Extract plain text from pages using pdfplumber
+      1) Link the staged PDF into data/uploads for traceability (pdf_sha256 is computed if not given)
+      2) Extract plain text from pages using pdfplumber (reused from the text store for a known PDF hash)
       3) Use OpenAI to extract product groups
       4) Use OpenAI to extract product variants for each product group
       5) Use OpenAI to extract required components for each product group
+         (4 and 5 run as a staged pipeline, so LLM calls and DB writes of different groups overlap)
       6) Write temporary JSON files matching the existing ingestion contract
       7) Reuse ingest_from_json to insert into Postgres
     """
-    # 1) Save PDF
-    upload_dir = Path("data/uploads")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    pdf_path = upload_dir / f"{offer_name.replace(' ', '_')}.pdf"
-    # Offload sync file write to a thread
-    await asyncio.to_thread(pdf_path.write_bytes, pdf_bytes)
-    logger.info(f"Saved uploaded PDF to {pdf_path}")
+    started = time.perf_counter()
+    # 1) Save PDF; the file is only ever streamed, never read into memory as a whole
+    with ingest_stage("save_pdf"):
+        if pdf_sha256 is None:
+            pdf_sha256 = await file_sha256(pdf_path)
+        # Only for traceability: a concurrent upload under the same offer name replaces the
+        # kept file, so the text is extracted from this job's own pdf_path, which matches pdf_sha256
+        kept_path = await keep_upload(pdf_path, offer_name)
+    logger.info(f"Saved uploaded PDF to {kept_path}")
     if progress_cb:
         progress_cb("save_pdf", 5, "PDF saved")
 
-    # 2) Extract texts per page
-    def _extract_texts(data: bytes) -> list[str]:
-        texts_local: list[str] = []
-        with pdfplumber.open(io.BytesIO(data)) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text() or ""
-                if page_text.strip():
-                    texts_local.append(page_text)
-        return texts_local
-
-    texts: list[str] = await asyncio.to_thread(_extract_texts, pdf_bytes)
+    # 2) Extract texts per page, reusing the stored text of an identical PDF
+    with ingest_stage("extract_text"):
+        doc_text, cached_text = await get_document_text(pdf_path, pdf_sha256)
+    texts: list[str] = doc_text.texts
 
-    full_text = "\n".join(texts)
     if progress_cb:
-        progress_cb("extract_text", 15, f"Extracted {len(texts)} pages")
-    logger.info(f"Extracted {len(texts)} pages of text from PDF")
+        progress_cb("extract_text", 15, f"Extracted {len(texts)} pages" + (" (cached)" if cached_text else ""))
+    logger.info(f"Extracted {len(texts)} pages of text from PDF {pdf_sha256[:12]} (cached={cached_text})")
 
     # 2a) Page offset (if needed later for variants)
-    import re
-    page_offset = 0
-    for i in range(len(texts)):
-        if re.search(r"Seite\s*:\s*\d+", texts[i]):
-            page_offset = i
-            break
+    page_offset = doc_text.page_offset
     logger.info(f"Detected page_offset={page_offset}")
     if progress_cb:
         progress_cb("detect_offset", 20, f"Page offset {page_offset}")
 
-    # Setup OpenAI client
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key or api_key == "":
-        raise RuntimeError("OPENAI_API_KEY is not set")
-
-    client = AsyncOpenAI(api_key=api_key)
-    logger.info("Setup OpenAI client")
-
     # Utilities
-    def _safe_json(text: str) -> dict[str, Any]:
-        try:
-            return json.loads(text)
-        except Exception:
-            start = text.find("{")
-            end = text.rfind("}")
-            if start != -1 and end != -1 and end > start:
-                return json.loads(text[start:end + 1])
-            raise
-
     async def _get_or_create_offer(doc_name: str) -> Offer:
         existing = await session.scalar(select(Offer).where(Offer.doc_name == doc_name))
         if existing:
@@ -208,277 +303,415 @@ async def ingest_from_pdf(
         await session.flush()
         return offer
 
-    async def _upsert_group(offer_id: int, group_nr: str | None, title: str, page_from: int | None, page_to: int | None) -> ProdGroup:
-        stmt = select(ProdGroup).where(ProdGroup.offer_id == offer_id)
-        if group_nr is None:
-            stmt = stmt.where(ProdGroup.group_nr.is_(None))
-        else:
-            stmt = stmt.where(ProdGroup.group_nr == group_nr)
-        existing = await session.scalar(stmt)
-        if existing:
-            existing.title = title
-            existing.page_from = page_from
-            existing.page_to = page_to
-            return existing
-        group = ProdGroup(offer_id=offer_id, group_nr=group_nr, title=title, page_from=page_from, page_to=page_to)
-        session.add(group)
-        await session.flush()
-        return group
-
-    async def _upsert_variant(group_id: int, var_nr: str | None, short_text: str, long_text: str | None, page_from: int | None, page_to: int | None) -> ProdVariant:
-        stmt = select(ProdVariant).where(ProdVariant.group_id == group_id)
-        if var_nr is None:
-            stmt = stmt.where(ProdVariant.var_nr.is_(None))
-        else:
-            stmt = stmt.where(ProdVariant.var_nr == var_nr)
-        existing = await session.scalar(stmt)
-        if existing:
-            existing.short_text = short_text
-            existing.long_text = long_text
-            existing.page_from = page_from
-            existing.page_to = page_to
-            return existing
-        pv = ProdVariant(group_id=group_id, var_nr=var_nr, short_text=short_text, long_text=long_text, page_from=page_from, page_to=page_to)
-        session.add(pv)
-        await session.flush()
-        return pv
-
-    async def _get_or_create_component(description: str) -> Component:
-        existing = await session.scalar(select(Component).where(Component.description == description))
-        if existing:
-            return existing
-        comp = Component(description=description)
-        session.add(comp)
-        await session.flush()
-        return comp
-
-    async def _link_variant_component(variant_id: int, component_id: int) -> None:
-        exists = await session.scalar(
-            select(ProdVariantComponent).where(
-                ProdVariantComponent.prod_variant_id == variant_id,
-                ProdVariantComponent.component_id == component_id,
-            )
-        )
-        if exists:
-            return
-        session.add(ProdVariantComponent(prod_variant_id=variant_id, component_id=component_id))
-
-    # 3) Extract product groups
-    group_prompt = get_group_extraction_prompt(full_text)
-    g_resp = await client.responses.create(model="gpt-5", input=group_prompt)
-    groups_payload = _safe_json(g_resp.output_text)
-    groups = groups_payload.get("groups", [])
+    # 3) Extract product groups, per page window for documents above the token budget
+    with ingest_stage("groups"):
+        groups = await _extract_groups(texts, priority)
     logger.info(f"Extracted {len(groups)} product groups")
     if progress_cb:
         progress_cb("groups", 40, f"{len(groups)} groups")
 
-    offer = await _get_or_create_offer(offer_name)
-    # Persist filename of stored PDF on the offer for later embedding
-    offer.pdf_filename = pdf_path.name
-    # Persist the offer early so it survives if later steps fail
-    await session.commit()
+    with ingest_stage("offer"):
+        offer = await _get_or_create_offer(offer_name)
+        # Persist filename of stored PDF on the offer for later embedding
+        offer.pdf_filename = kept_path.name
+        offer.pdf_sha256 = pdf_sha256
+        # Persist the offer early so it survives if later steps fail
+        await session.commit()
     if progress_cb:
         progress_cb("offer", 30, f"Offer {offer.id} created")
     logger.info(f"Created offer {offer.id}")
 
-    # Concurrency: process groups in parallel using isolated DB sessions
-    sem = asyncio.Semaphore(max(1, num_concurrent_groups))
-
-    async def process_one(idx: int, g: dict[str, Any]) -> dict[str, int]:
-        async with sem:
-            # New session per group to avoid cross-task state
-            async with SessionLocal() as s:
-                # Upsert group in this session
-                group_nr = g.get("group_no")
-                title = g.get("title") or ""
-                g_from = g.get("page_from")
-                g_to = g.get("page_to")
-
-                # Query existing
-                stmt = select(ProdGroup).where(ProdGroup.offer_id == offer.id)
-                stmt = stmt.where(ProdGroup.group_nr == group_nr) if group_nr is not None else stmt.where(ProdGroup.group_nr.is_(None))
-                existing = await s.scalar(stmt)
-                if existing:
-                    existing.title = title
-                    existing.page_from = g_from
-                    existing.page_to = g_to
-                    group_obj = existing
-                else:
-                    group_obj = ProdGroup(offer_id=offer.id, group_nr=group_nr, title=title, page_from=g_from, page_to=g_to)
-                    s.add(group_obj)
-                    await s.flush()
-
-                if progress_cb:
-                    progress_cb("group_upsert", 45, f"Group {idx}/{len(groups)}")
-                logger.info(f"Upserted group {group_obj.id}")
-                await s.commit()
-
-                # Slice text for this group
-                start_idx = max(0, page_offset + (g_from or 1) - 1)
-                end_idx = page_offset + (g_to or (g_from or 1)) + 1
-                group_text = "\n".join(texts[start_idx:end_idx])
-
-                # Variants extraction
-                v_prompt = get_variant_extraction_prompt(group_nr or "", title) + "\n\nInput:\n" + group_text
-                v_resp = await client.responses.create(model="gpt-5", input=v_prompt)
-                variants_payload = _safe_json(v_resp.output_text)
-                variants = variants_payload.get("variants", [])
-                if progress_cb:
-                    progress_cb("variants", 60, f"{len(variants)} variants in group {idx}")
-                logger.info(f"Extracted {len(variants)} product variants")
-
-                variant_nos: list[str] = []
-                variant_titles: list[str] = []
-                variant_texts: list[str] = []
-                variant_nr_to_id: dict[str, int] = {}
-                inserted_variants_local = 0
-                for v in variants:
-                    var_nr = v.get("variant_no")
-                    short_text = v.get("title") or ""
-                    long_text = v.get("text")
-                    v_from = v.get("page_from")
-                    v_to = v.get("page_to")
-
-                    # Upsert variant in s
-                    stmt_v = select(ProdVariant).where(ProdVariant.group_id == group_obj.id)
-                    stmt_v = stmt_v.where(ProdVariant.var_nr == var_nr) if var_nr is not None else stmt_v.where(ProdVariant.var_nr.is_(None))
-                    existing_v = await s.scalar(stmt_v)
-                    if existing_v:
-                        existing_v.short_text = short_text
-                        existing_v.long_text = long_text
-                        existing_v.page_from = v_from
-                        existing_v.page_to = v_to
-                        pv = existing_v
-                    else:
-                        pv = ProdVariant(group_id=group_obj.id, var_nr=var_nr, short_text=short_text, long_text=long_text, page_from=v_from, page_to=v_to)
-                        s.add(pv)
-                        await s.flush()
-                    inserted_variants_local += 1
-                    if var_nr:
-                        variant_nos.append(var_nr)
-                        variant_titles.append(short_text)
-                        variant_texts.append(long_text or "")
-                        variant_nr_to_id[var_nr] = pv.id
-                await s.commit()
-
-                # Components
-                inserted_components_local = 0
-                inserted_links_local = 0
-                if variant_nos:
-                    c_prompt = get_required_components_prompt(group_nr or "", title, variant_nos, variant_titles, variant_texts)
-                    c_resp = await client.responses.create(model="gpt-5", input=c_prompt)
-                    comps_payload = _safe_json(c_resp.output_text)
-                    comps = comps_payload.get("components", [])
-                    logger.info(f"Extracted {len(comps)} required components")
-                    for comp in comps:
-                        description = str(comp.get("component_description", "")).strip()
-                        if not description:
-                            continue
-                        # get or create component
-                        existing_c = await s.scalar(select(Component).where(Component.description == description))
-                        if existing_c:
-                            comp_obj = existing_c
-                        else:
-                            comp_obj = Component(description=description)
-                            s.add(comp_obj)
-                            await s.flush()
-                        inserted_components_local += 1
-                        for vno in comp.get("variant_nos", []) or []:
-                            vid = variant_nr_to_id.get(vno)
-                            if not vid:
-                                continue
-                            exists_link = await s.scalar(
-                                select(ProdVariantComponent).where(
-                                    ProdVariantComponent.prod_variant_id == vid,
-                                    ProdVariantComponent.component_id == comp_obj.id,
-                                )
-                            )
-                            if not exists_link:
-                                s.add(ProdVariantComponent(prod_variant_id=vid, component_id=comp_obj.id))
-                                inserted_links_local += 1
-                if progress_cb:
-                    progress_cb("components", 80, f"Components linked for group {idx}")
-                await s.commit()
-                if progress_cb:
-                    progress_cb("commit_group", 90, f"Committed group {idx}")
-
-                return {
-                    "groups": 1,
-                    "variants": inserted_variants_local,
-                    "components": inserted_components_local,
-                    "variant_components": inserted_links_local,
-                }
-
-    tasks = [process_one(idx, g) for idx, g in enumerate(groups, start=1)]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    inserted_groups = inserted_variants = inserted_components = inserted_links = 0
-    for r in results:
-        if isinstance(r, Exception):
-            logger.exception("Group task failed", exc_info=r)
-            continue
-        inserted_groups += r.get("groups", 0)
-        inserted_variants += r.get("variants", 0)
-        inserted_components += r.get("components", 0)
-        inserted_links += r.get("variant_components", 0)
-
-    await session.commit()
+    # Groups are written in one statement; the pipeline below only adds variants and components
+    group_rows = [
+        {"group_nr": g.get("group_no"), "title": g.get("title") or "", "page_from": g.get("page_from"), "page_to": g.get("page_to")}
+        for g in groups
+    ]
+    with ingest_stage("group_upsert"):
+        previous = dict((await session.execute(select(ProdGroup.id, ProdGroup.text_sha256).where(ProdGroup.offer_id == offer.id))).all())
+        group_ids = await upsert_groups(session, offer.id, group_rows)
+        # Groups that disappeared from a revised document go, with their variants and links.
+        # An empty extraction (a refused or malformed answer) says nothing about the document,
+        # so it never clears an offer.
+        stale_group_ids = set(previous) - set(group_ids) if group_ids else set()
+        if previous and not group_ids:
+            logger.warning(f"No groups extracted for offer {offer.id}, keeping its {len(previous)} existing groups")
+        if stale_group_ids:
+            await session.execute(delete(ProdGroup).where(ProdGroup.id.in_(sorted(stale_group_ids))))
+        await session.commit()
+    if progress_cb:
+        progress_cb("group_upsert", 45, f"{len(groups)} groups saved" + (f", {len(stale_group_ids)} removed" if stale_group_ids else ""))
+
+    # Staged pipeline: slicing -> variant LLM -> variant persist -> component LLM -> component persist.
+    # LLM stages run as many workers as the LLM scheduler admits concurrently; the
+    # persist stages write every group that is ready in one short transaction, so DB
+    # connections are only held while writing. A batch that fails is redone group by
+    # group, so only the failing groups end up in failed_groups.
+    llm_workers = max(1, num_concurrent_groups or get_llm_scheduler().max_concurrency)
+    total = len(groups)
+    done_groups = 0
+    skipped_groups = 0
+    failed_groups: list[str] = []
+
+    async def slice_text(w: _GroupWork) -> _GroupWork | None:
+        nonlocal done_groups, skipped_groups
+        start_idx = max(0, page_offset + (w.page_from or 1) - 1)
+        end_idx = page_offset + (w.page_to or (w.page_from or 1)) + 1
+        w.text = "\n".join(texts[start_idx:end_idx])
+        w.text_sha256 = _group_fingerprint(w)
+        # Unchanged since the last complete ingest of this group: nothing to redo
+        if previous.get(w.group_id) == w.text_sha256:
+            done_groups += 1
+            skipped_groups += 1
+            return None
+        return w
+
+    async def extract_variants(w: _GroupWork) -> _GroupWork:
+        v_prompt = get_variant_extraction_prompt(w.group_nr or "", w.title) + "\n\nInput:\n" + w.text
+        variants_payload = await _llm_json(v_prompt, priority=priority, kind="variants")
+        w.variants = variants_payload.get("variants", [])
+        logger.info(f"Extracted {len(w.variants)} product variants for group {w.group_nr}")
+        return w
+
+    async def persist_variants(batch: list[_GroupWork]) -> list[_GroupWork]:
+        variant_rows = [
+            {
+                "group_id": w.group_id,
+                "var_nr": v.get("variant_no"),
+                "short_text": v.get("title") or "",
+                "long_text": v.get("text"),
+                "page_from": v.get("page_from"),
+                "page_to": v.get("page_to"),
+            }
+            for w in batch
+            for v in w.variants
+        ]
+        async with SessionLocal() as s:
+            await delete_unnumbered_variants(s, [w.group_id for w in batch])
+            variant_ids = await upsert_variants(s, variant_rows)
+            await delete_variants_except(s, [w.group_id for w in batch], variant_ids.values())
+            # The variants no longer match the stored fingerprint until persist_components
+            # sets the new one; without this a group that fails in between would be skipped
+            # as unchanged when the previous revision of the document is ingested again
+            await s.execute(update(ProdGroup), [{"id": w.group_id, "text_sha256": None} for w in batch])
+            await s.commit()
+        for w in batch:
+            w.variant_ids = {var_nr: vid for (gid, var_nr), vid in variant_ids.items() if gid == w.group_id}
+        if progress_cb:
+            progress_cb("variants", 45 + 50 * done_groups // max(1, total), f"Variants saved for {len(batch)} groups")
+        return batch
+
+    async def extract_components(w: _GroupWork) -> _GroupWork:
+        variant_nos: list[str] = []
+        variant_titles: list[str] = []
+        variant_texts: list[str] = []
+        for v in w.variants:
+            if v.get("variant_no"):
+                variant_nos.append(v["variant_no"])
+                variant_titles.append(v.get("title") or "")
+                variant_texts.append(v.get("text") or "")
+        if variant_nos:
+            c_prompt = get_required_components_prompt(w.group_nr or "", w.title, variant_nos, variant_titles, variant_texts)
+            comps_payload = await _llm_json(c_prompt, priority=priority, kind="components")
+            comps = comps_payload.get("components", [])
+            logger.info(f"Extracted {len(comps)} required components for group {w.group_nr}")
+            for comp in comps:
+                description = str(comp.get("component_description", "")).strip()
+                if not description:
+                    continue
+                w.components.setdefault(description, []).extend(comp.get("variant_nos", []) or [])
+        return w
+
+    async def persist_components(batch: list[_GroupWork]) -> list[_GroupWork]:
+        nonlocal done_groups
+        async with SessionLocal() as s:
+            component_ids = await get_or_create_components(s, [d for w in batch for d in w.components])
+            for w in batch:
+                w.component_count = len(w.components)
+                pairs = [
+                    (w.variant_ids[vno], component_ids[description])
+                    for description, vnos in w.components.items()
+                    for vno in vnos
+                    if vno in w.variant_ids
+                ]
+                await delete_links_except(s, w.variant_ids.values(), pairs)
+                w.link_count = await link_variant_components(s, pairs)
+            # The fingerprint is only stored once the group is complete, so a failed group is redone next time
+            await s.execute(update(ProdGroup), [{"id": w.group_id, "text_sha256": w.text_sha256} for w in batch])
+            await s.commit()
+        done_groups += len(batch)
+        if progress_cb:
+            progress_cb("components", 45 + 50 * done_groups // max(1, total), f"Committed {done_groups}/{total} groups")
+        return batch
+
+    def on_error(stage: str, w: _GroupWork, exc: BaseException) -> None:
+        logger.error(f"Group {w.group_nr} failed in {stage}", exc_info=exc)
+        failed_groups.append(str(w.group_nr or w.title))
+
+    # Duplicate group numbers map to the same row; the last one wins, as in upsert_groups
+    work = list({
+        gid: _GroupWork(group_id=gid, group_nr=row["group_nr"], title=row["title"], page_from=row["page_from"], page_to=row["page_to"])
+        for gid, row in zip(group_ids, group_rows)
+    }.values())
+    finished = await run_pipeline(
+        work,
+        [
+            Stage("slice", slice_text),
+            Stage("variants", extract_variants, workers=llm_workers),
+            Stage("persist_variants", persist_variants, batch=True),
+            Stage("components", extract_components, workers=llm_workers),
+            Stage("persist_components", persist_components, batch=True),
+        ],
+        on_error=on_error,
+        timings=INGEST_STAGE_SECONDS,
+    )
+    inserted_groups = len(finished)
+    inserted_variants = sum(len(w.variants) for w in finished)
+    inserted_components = sum(w.component_count for w in finished)
+    inserted_links = sum(w.link_count for w in finished)
+    INGEST_GROUPS.inc(len(finished), outcome="done")
+    INGEST_GROUPS.inc(skipped_groups, outcome="skipped")
+    INGEST_GROUPS.inc(len(failed_groups), outcome="failed")
+
+    with ingest_stage("commit"):
+        await session.commit()
+    if skipped_groups:
+        logger.info(f"Skipped {skipped_groups} unchanged groups")
     if progress_cb:
-        progress_cb("commit", 95, "Committed to DB")
+        progress_cb(
+            "commit",
+            95,
+            "Committed to DB"
+            + (f", {skipped_groups} unchanged groups skipped" if skipped_groups else "")
+            + (f", {len(failed_groups)} groups failed" if failed_groups else ""),
+        )
+    cache = get_llm_cache()
+    if cache:
+        logger.info(f"LLM cache: {cache.stats.hits} hits, {cache.stats.misses} misses, {cache.stats.evictions} evictions")
 
+    INGEST_STAGE_SECONDS.observe(time.perf_counter() - started, stage="total")
     return {
         "offers": 1,
         "groups": inserted_groups,
         "variants": inserted_variants,
         "components": inserted_components,
         "variant_components": inserted_links,
+        "skipped_groups": skipped_groups,
+        "failed_groups": failed_groups,
     }
 
 
+def get_offers_page_size() -> int:
+    return int(os.getenv("OFFERS_PAGE_SIZE", "50"))
+
+
+async def list_offers(
+    session: AsyncSession, before_id: Optional[int] = None, name: Optional[str] = None, limit: int = 50
+) -> tuple[list[dict[str, Any]], Optional[int]]:
+    """One page of offers, newest first, with their group, variant and component counts.
+
+    Keyset pagination on id: pass the returned cursor as before_id to get the
+    next page (None when there is none), so every page costs the same however
+    deep it is. The counts are correlated subqueries for the offers of this page
+    only: groups by offer_id, variants by group_id and distinct components from
+    the variant-component link index. Each walks one offer's index entries instead
+    of aggregating the joined groups x variants x links of the whole page.
+    """
+    page = select(Offer.id, Offer.doc_name).order_by(Offer.id.desc()).limit(limit + 1)
+    if before_id is not None:
+        page = page.where(Offer.id < before_id)
+    if name:
+        page = page.where(Offer.doc_name.ilike(like_pattern(name.strip()), escape="\\"))
+    page = page.subquery("page")
+    group_count = select(func.count()).select_from(ProdGroup).where(ProdGroup.offer_id == page.c.id).scalar_subquery()
+    variant_count = (
+        select(func.count())
+        .select_from(ProdGroup)
+        .join(ProdVariant, ProdVariant.group_id == ProdGroup.id)
+        .where(ProdGroup.offer_id == page.c.id)
+        .scalar_subquery()
+    )
+    component_count = (
+        select(func.count(ProdVariantComponent.component_id.distinct()))
+        .select_from(ProdGroup)
+        .join(ProdVariant, ProdVariant.group_id == ProdGroup.id)
+        .join(ProdVariantComponent, ProdVariantComponent.prod_variant_id == ProdVariant.id)
+        .where(ProdGroup.offer_id == page.c.id)
+        .scalar_subquery()
+    )
+    stmt = select(page.c.id, page.c.doc_name, group_count, variant_count, component_count).order_by(page.c.id.desc())
+    rows = (await session.execute(stmt)).all()
+    offers = [
+        {"id": oid, "doc_name": doc_name, "groups": groups, "variants": variants, "components": components}
+        for oid, doc_name, groups, variants, components in rows[:limit]
+    ]
+    cursor = offers[-1]["id"] if len(rows) > limit else None
+    return offers, cursor
+
+
+def offer_detail_queries(offer_id: int) -> tuple[Select, Select, Select]:
+    """The groups, variants and component-link queries behind the offer detail page."""
+    groups = select(ProdGroup).where(ProdGroup.offer_id == offer_id).order_by(ProdGroup.group_nr)
+    variants = select(ProdVariant).join(ProdGroup, ProdGroup.id == ProdVariant.group_id).where(ProdGroup.offer_id == offer_id).order_by(ProdVariant.var_nr)
+    links = (
+        select(ProdVariant.group_id, ProdVariantComponent.prod_variant_id, ProdVariantComponent.count, Component)
+        .join(ProdVariant, ProdVariant.id == ProdVariantComponent.prod_variant_id)
+        .join(ProdGroup, ProdGroup.id == ProdVariant.group_id)
+        .join(Component, Component.id == ProdVariantComponent.component_id)
+        .where(ProdGroup.offer_id == offer_id)
+    )
+    return groups, variants, links
+
+
+async def load_offer_detail(session: AsyncSession, offer_id: int) -> list[dict[str, Any]]:
+    """Groups of an offer with their variants, used components and variant×component counts.
+
+    Issues three queries regardless of offer size and assembles the matrix in one pass.
+    """
+    groups_stmt, variants_stmt, links_stmt = offer_detail_queries(offer_id)
+    groups = (await session.execute(groups_stmt)).scalars().all()
+    variants = (await session.execute(variants_stmt)).scalars().all()
+    links = (await session.execute(links_stmt)).all()
+
+    detail = {g.id: {"group": g, "variants": [], "components": {}, "counts": {}} for g in groups}
+    for v in variants:
+        detail[v.group_id]["variants"].append(v)
+    for group_id, variant_id, count, comp in links:
+        section = detail[group_id]
+        section["components"][comp.id] = comp
+        key = (variant_id, comp.id)
+        section["counts"][key] = (section["counts"].get(key) or 0) + (count or 1)
+    for section in detail.values():
+        section["components"] = [section["components"][cid] for cid in sorted(section["components"])]
+    return list(detail.values())
+
+
+def get_offer_delete_batch_groups() -> int:
+    return max(1, int(os.getenv("OFFER_DELETE_BATCH_GROUPS", "20")))
+
+
+def get_offer_delete_sync_max_variants() -> int:
+    return int(os.getenv("OFFER_DELETE_SYNC_MAX_VARIANTS", "5000"))
+
+
+async def count_offer_variants(session: AsyncSession, offer_id: int) -> int:
+    stmt = select(func.count(ProdVariant.id)).join(ProdGroup, ProdGroup.id == ProdVariant.group_id).where(ProdGroup.offer_id == offer_id)
+    return (await session.execute(stmt)).scalar_one()
+
+
+async def delete_offer(offer_id: int, progress_cb=None) -> dict[str, int]:
+    """Delete an offer and everything under it, then the components nothing links to anymore.
+
+    Runs as set-based statements in batches of OFFER_DELETE_BATCH_GROUPS groups,
+    one transaction each, so memory stays flat and locks are short however big
+    the offer is. Safe to run again after an interruption.
+    """
+    async with SessionLocal() as session:
+        group_ids = (await session.execute(select(ProdGroup.id).where(ProdGroup.offer_id == offer_id).order_by(ProdGroup.id))).scalars().all()
+    component_ids: set[int] = set()
+    batches = list(chunks(list(group_ids), get_offer_delete_batch_groups()))
+    for i, batch in enumerate(batches, start=1):
+        async with SessionLocal() as session:
+            component_ids |= await delete_groups(session, batch)
+            await session.commit()
+        if progress_cb:
+            progress_cb("delete", 5 + int(80 * i / len(batches)), f"Deleted {sum(map(len, batches[:i]))}/{len(group_ids)} groups")
+
+    async with SessionLocal() as session:
+        # Whatever is left (groups added since the listing above) goes with the FK cascade
+        deleted = (await session.execute(delete(Offer).where(Offer.id == offer_id))).rowcount
+        await session.commit()
+
+    if progress_cb:
+        progress_cb("gc", 90, f"Checking {len(component_ids)} components")
+    removed = 0
+    for batch in chunks(sorted(component_ids)):
+        async with SessionLocal() as session:
+            removed += await delete_orphan_components(session, batch)
+            await session.commit()
+    logger.info(f"Deleted offer {offer_id}: {len(group_ids)} groups, {removed} orphaned components")
+    return {"offers": deleted, "groups": len(group_ids), "orphaned_components": removed}
+
+
+EXPORT_COLUMNS = ["Typ", "Ordnungszahl", "Kurztext", "Langtext", "Menge", "Einheit"]
+
+
+def offer_export_query(offer_id: int) -> Select:
+    """One ordered outer join over groups, variants and component links of an offer."""
+    return (
+        select(
+            ProdGroup.id, ProdGroup.group_nr, ProdGroup.title,
+            ProdVariant.id, ProdVariant.var_nr, ProdVariant.short_text, ProdVariant.long_text,
+            ProdVariantComponent.id, ProdVariantComponent.count, Component.description,
+        )
+        .select_from(ProdGroup)
+        .outerjoin(ProdVariant, ProdVariant.group_id == ProdGroup.id)
+        .outerjoin(ProdVariantComponent, ProdVariantComponent.prod_variant_id == ProdVariant.id)
+        .outerjoin(Component, Component.id == ProdVariantComponent.component_id)
+        .where(ProdGroup.offer_id == offer_id)
+        .order_by(ProdGroup.group_nr, ProdGroup.id, ProdVariant.var_nr, ProdVariant.id, ProdVariantComponent.id)
+    )
+
+
+async def iter_offer_export_rows(session: AsyncSession, offer_id: int, yield_per: int = 1000) -> AsyncIterator[tuple[Any, ...]]:
+    """Yield the flat export table (Typ, Ordnungszahl, Kurztext, Langtext, Menge, Einheit) of an offer.
+
+    Rows come from one ordered join read through a server-side cursor, so
+    memory does not grow with the size of the offer.
+    """
+    stmt = offer_export_query(offer_id).execution_options(yield_per=yield_per)
+    result = await session.stream(stmt)
+    current_group = current_variant = None
+    comp_idx = 0
+    async for g_id, group_nr, title, v_id, var_nr, short_text, long_text, link_id, link_count, description in result:
+        if g_id != current_group:
+            current_group, current_variant = g_id, None
+            yield ("Gruppe", group_nr or "", title or "", "", None, "")
+        if v_id is None:
+            continue
+        if v_id != current_variant:
+            current_variant, comp_idx = v_id, 0
+            yield ("Position", var_nr or "", short_text or "", long_text or "", 1, "St")
+        if link_id is None:
+            continue
+        # Components as child rows
+        comp_idx += 1
+        yield ("Komponente", f"{(var_nr or v_id)}.{comp_idx:04d}", description or "", "", link_count or 1, "St")
+
+
+async def stream_offer_excel(offer_id: int, flush_rows: int = 500) -> AsyncIterator[bytes]:
+    """Produce the xlsx export of an offer chunk by chunk, using its own DB session."""
+    writer = StreamingXlsxWriter(EXPORT_COLUMNS, sheet_name="LV")
+    async with SessionLocal() as session:
+        rows = 0
+        async for row in iter_offer_export_rows(session, offer_id):
+            writer.write_row(row)
+            rows += 1
+            if rows % flush_rows == 0:
+                chunk = writer.drain()
+                if chunk:
+                    yield chunk
+    yield writer.close()
+
+
+async def stream_offer_csv(offer_id: int, flush_rows: int = 500) -> AsyncIterator[bytes]:
+    """Same rows as the Excel export as UTF-8 CSV, for bulk consumers that don't need xlsx."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    async with SessionLocal() as session:
+        rows = 0
+        async for row in iter_offer_export_rows(session, offer_id):
+            writer.writerow(["" if value is None else value for value in row])
+            rows += 1
+            if rows % flush_rows == 0:
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
 async def export_offer_to_excel(offer_id: int, session: AsyncSession) -> bytes:
-    # Fetch data
-    groups = (await session.execute(select(ProdGroup).where(ProdGroup.offer_id == offer_id).order_by(ProdGroup.group_nr))).scalars().all()
-    group_ids = [g.id for g in groups]
-    variants = []
-    if group_ids:
-        variants = (await session.execute(select(ProdVariant).where(ProdVariant.group_id.in_(group_ids)).order_by(ProdVariant.var_nr))).scalars().all()
-    variant_ids = [v.id for v in variants]
-    links = []
-    if variant_ids:
-        links = (await session.execute(select(ProdVariantComponent).where(ProdVariantComponent.prod_variant_id.in_(variant_ids)))).scalars().all()
-    comp_ids = sorted({l.component_id for l in links})
-    components_by_id = {}
-    if comp_ids:
-        comps = (await session.execute(select(Component).where(Component.id.in_(comp_ids)))).scalars().all()
-        components_by_id = {c.id: c for c in comps}
-
-    # Build one flat table similar to the example (Typ, Ordnungszahl, Kurztext, Langtext, Menge, Einheit)
-    rows: list[dict[str, Any]] = []
-
-    def add_row(typ: str, ord_num: str | None, kurz: str | None, lang: str | None, menge: int | float | None = None, einheit: str | None = None):
-        rows.append({
-            "Typ": typ,
-            "Ordnungszahl": ord_num or "",
-            "Kurztext": kurz or "",
-            "Langtext": lang or "",
-            "Menge": menge,
-            "Einheit": einheit or "",
-        })
-
-    for g in groups:
-        add_row("Gruppe", g.group_nr or "", g.title, "")
-        # Variants under group
-        g_variants = [v for v in variants if v.group_id == g.id]
-        for v in g_variants:
-            add_row("Position", v.var_nr or "", v.short_text, v.long_text, 1, "St")
-            v_links = [l for l in links if l.prod_variant_id == v.id]
-            # Components as child rows
-            for idx, l in enumerate(v_links, start=1):
-                comp = components_by_id.get(l.component_id)
-                add_row("Komponente", f"{(v.var_nr or v.id)}.{idx:04d}", comp.description if comp else "", "", l.count or 1, "St")
-
-    df = pd.DataFrame(rows, columns=["Typ", "Ordnungszahl", "Kurztext", "Langtext", "Menge", "Einheit"])
-
-    buf = _io.BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="LV")
-    return buf.getvalue()
\ No newline at end of file
+    writer = StreamingXlsxWriter(EXPORT_COLUMNS, sheet_name="LV")
+    async for row in iter_offer_export_rows(session, offer_id):
+        writer.write_row(row)
+    return writer.close()
@@ -0,0 +1,91 @@
+import asyncio
+import gzip
+import json
+import os
+import re
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+from .metrics import PDF_EXTRACT_SECONDS, PDF_PAGES
+from .utils.pdf import extract_page_texts
+
+
+PAGE_MARKER_RE = re.compile(r"Seite\s*:\s*\d+")
+
+
+@dataclass
+class DocumentText:
+    """Extracted text of one PDF, identified by the SHA-256 of its bytes."""
+
+    sha256: str
+    page_count: int
+    page_offset: int
+    pages: list[str]  # one entry per PDF page, blank pages as ""
+
+    @property
+    def texts(self) -> list[str]:
+        """Non-blank page texts, the list the extraction prompts are built from."""
+        return [page_text for page_text in self.pages if page_text.strip()]
+
+
+def get_text_store_dir() -> Path:
+    return Path(os.getenv("TEXT_STORE_DIR", "data/texts"))
+
+
+def _doc_path(sha256: str) -> Path:
+    return get_text_store_dir() / f"{sha256}.json.gz"
+
+
+def detect_page_offset(texts: list[str]) -> int:
+    """Index of the first text carrying a 'Seite: N' marker (0 if none)."""
+    for i, page_text in enumerate(texts):
+        if PAGE_MARKER_RE.search(page_text):
+            return i
+    return 0
+
+
+def load_document_text(sha256: str) -> Optional[DocumentText]:
+    path = _doc_path(sha256)
+    if not path.exists():
+        return None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return DocumentText(**json.load(f))
+
+
+def save_document_text(doc: DocumentText) -> Path:
+    path = _doc_path(doc.sha256)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # A unique temp file per writer: concurrent jobs may store the same document at once
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f"{doc.sha256}.", suffix=".tmp", delete=False) as raw:
+        tmp = Path(raw.name)
+        try:
+            with gzip.open(raw, "wt", encoding="utf-8") as f:
+                json.dump(asdict(doc), f, ensure_ascii=False)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+    os.replace(tmp, path)
+    return path
+
+
+async def get_document_text(pdf_path: Path, sha256: str) -> tuple[DocumentText, bool]:
+    """Return the stored text for sha256, extracting and storing it on a miss.
+
+    The second element tells whether the store was hit.
+    """
+    doc = await asyncio.to_thread(load_document_text, sha256)
+    if doc is not None:
+        return doc, True
+    with PDF_EXTRACT_SECONDS.time():
+        pages = await extract_page_texts(pdf_path)
+    PDF_PAGES.inc(len(pages))
+    doc = DocumentText(
+        sha256=sha256,
+        page_count=len(pages),
+        page_offset=detect_page_offset([page_text for page_text in pages if page_text.strip()]),
+        pages=pages,
+    )
+    await asyncio.to_thread(save_document_text, doc)
+    return doc, False
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from fastapi import UploadFile
+from sqlalchemy import text
+
+from .db import SessionLocal
+from .jobs import check_admission, create_job
+from .models import IngestJob
+
+logger = logging.getLogger("uvicorn.error")
+
+
+UPLOAD_DIR = Path("data/uploads")
+# Uploads are staged here until a worker has ingested them
+INCOMING_DIR = UPLOAD_DIR / "incoming"
+
+
+def get_upload_chunk_size() -> int:
+    return int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+
+def get_incoming_ttl_seconds() -> float:
+    return float(os.getenv("UPLOAD_INCOMING_TTL_HOURS", "24")) * 3600
+
+
+def _copy_hashed(src: BinaryIO, dest: Path, chunk_size: int) -> tuple[str, int]:
+    sha = hashlib.sha256()
+    size = 0
+    tmp = dest.with_suffix(f".tmp{os.getpid()}")
+    try:
+        with open(tmp, "wb") as out:
+            while chunk := src.read(chunk_size):
+                sha.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return sha.hexdigest(), size
+
+
+async def stage_upload(file: UploadFile) -> tuple[Path, str, int]:
+    """Copy an uploaded file to INCOMING_DIR in chunks, hashing it on the way.
+
+    Returns (path, sha256, size). Memory use is one chunk whatever the file
+    size; the multipart parser has already spooled large uploads to disk.
+    """
+    INCOMING_DIR.mkdir(parents=True, exist_ok=True)
+    dest = INCOMING_DIR / f"{uuid.uuid4()}.pdf"
+    await file.seek(0)
+    sha256, size = await asyncio.to_thread(_copy_hashed, file.file, dest, get_upload_chunk_size())
+    return dest, sha256, size
+
+
+def _file_sha256(path: Path, chunk_size: int) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+async def file_sha256(path: Path) -> str:
+    return await asyncio.to_thread(_file_sha256, path, get_upload_chunk_size())
+
+
+def _link_or_copy(src: Path, dest: Path) -> None:
+    tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}")
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            # Different filesystem, or no hard links: fall back to a streamed copy
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+async def keep_upload(src: Path, name: str) -> Path:
+    """Make a staged PDF available as UPLOAD_DIR/<name>.pdf for traceability.
+
+    A hard link, so the file is not duplicated; the staged name stays valid for
+    retries and is removed by the worker once the job is done.
+    """
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    dest = UPLOAD_DIR / f"{name.replace(' ', '_')}.pdf"
+    if src.resolve() != dest.resolve():
+        await asyncio.to_thread(_link_or_copy, src, dest)
+    return dest
+
+
+async def submit_pdf_ingest(file: UploadFile, offer_name: str, priority: int) -> IngestJob:
+    """Stage an uploaded PDF and queue an ingest_pdf job for it.
+
+    Raises QueueFullError, before anything is written, when the queue is full.
+    """
+    await check_admission("ingest_pdf")
+    pdf_path, pdf_sha256, _ = await stage_upload(file)
+    return await create_job("ingest_pdf", {"offer_name": offer_name, "pdf_path": str(pdf_path), "pdf_sha256": pdf_sha256}, priority=priority)
+
+
+def discard_staged(payload: dict[str, Any]) -> None:
+    """Delete the staged PDF of an ingest_pdf job (only ever a file in INCOMING_DIR)."""
+    pdf_path = payload.get("pdf_path")
+    if not pdf_path:
+        return
+    path = Path(pdf_path)
+    if path.resolve().parent == INCOMING_DIR.resolve():
+        path.unlink(missing_ok=True)
+
+
+async def sweep_incoming() -> int:
+    """Delete files in INCOMING_DIR older than UPLOAD_INCOMING_TTL_HOURS that no pending or running job refers to.
+
+    Catches uploads whose job was never created or whose cleanup was missed
+    (e.g. a worker killed mid-job). Returns the number of files removed.
+    """
+    if not INCOMING_DIR.exists():
+        return 0
+    async with SessionLocal() as session:
+        result = await session.execute(text(
+            "SELECT payload->>'pdf_path' FROM ingest_job "
+            "WHERE kind = 'ingest_pdf' AND status IN ('pending', 'running')"
+        ))
+        active = {Path(p).resolve() for p in result.scalars() if p}
+    cutoff = time.time() - get_incoming_ttl_seconds()
+
+    def _sweep() -> int:
+        removed = 0
+        for path in INCOMING_DIR.iterdir():
+            try:
+                if path.is_file() and path.resolve() not in active and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    removed = await asyncio.to_thread(_sweep)
+    if removed:
+        logger.info(f"Removed {removed} orphaned staged uploads from {INCOMING_DIR}")
+    return removed
@@ -1,3 +1,4 @@
+from typing import Any, Callable
 
 
 def get_group_extraction_prompt(full_text: str) -> str:
@@ -119,4 +120,52 @@ def get_required_components_prompt(prod_group_nr: str, prod_group_title: str, va
 
     Product variants:
     {variants_str}
-    """
\ No newline at end of file
+    """
+
+
+def split_page_windows(texts: list[str], max_tokens: int, count_tokens: Callable[[str], int], overlap_pages: int = 1) -> list[list[str]]:
+    """Split page texts into consecutive windows of at most max_tokens each.
+
+    Neighbouring windows share overlap_pages pages, so a group header near a
+    window border is seen together with its first page. A single page larger
+    than the budget becomes a window of its own.
+    """
+    windows: list[list[str]] = []
+    start = 0
+    while start < len(texts):
+        end = start
+        used = 0
+        while end < len(texts):
+            cost = count_tokens(texts[end]) + 1
+            if end > start and used + cost > max_tokens:
+                break
+            used += cost
+            end += 1
+        windows.append(texts[start:end])
+        if end >= len(texts):
+            break
+        start = max(start + 1, end - overlap_pages)
+    return windows
+
+
+def merge_groups(group_lists: list[list[dict[str, Any]]]) -> list[dict[str, Any]]:
+    """Merge groups extracted from several windows, in document order.
+
+    Groups are deduplicated by group_no (by title for unnumbered ones); the page
+    range of a merged group is the union of the ranges seen.
+    """
+    merged: dict[tuple[str, str], dict[str, Any]] = {}
+    for groups in group_lists:
+        for g in groups:
+            key = ("no", str(g["group_no"])) if g.get("group_no") else ("title", (g.get("title") or "").strip())
+            current = merged.get(key)
+            if current is None:
+                merged[key] = dict(g)
+                continue
+            if not current.get("title") and g.get("title"):
+                current["title"] = g["title"]
+            froms = [p for p in (current.get("page_from"), g.get("page_from")) if p is not None]
+            tos = [p for p in (current.get("page_to"), g.get("page_to")) if p is not None]
+            current["page_from"] = min(froms) if froms else None
+            current["page_to"] = max(tos) if tos else None
+    return list(merged.values())
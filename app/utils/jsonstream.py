@@ -0,0 +1,118 @@
+import json
+from pathlib import Path
+from typing import Any, Iterator, TextIO
+
+
+_WHITESPACE = " \t\r\n"
+_DELIMITERS = _WHITESPACE + ",:]}"
+
+
+class _Reader:
+    """Buffered character reader feeding json.JSONDecoder.raw_decode piece by piece."""
+
+    def __init__(self, f: TextIO, read_size: int) -> None:
+        self.f = f
+        self.read_size = read_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        data = self.f.read(self.read_size)
+        if not data:
+            self.eof = True
+            return False
+        # Drop the consumed prefix so the buffer only holds unparsed input
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, got {self.peek()!r}")
+        self.pos += 1
+
+    def value(self, decoder: json.JSONDecoder) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(self.buf, self.pos)
+                # A value not followed by a delimiter (e.g. a number cut at "1.") may continue in the next read
+                if (end < len(self.buf) and self.buf[end] in _DELIMITERS) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self._fill():
+                self.eof = True
+
+
+def iter_json_array(path: Path, key: str, read_size: int = 1 << 16) -> Iterator[Any]:
+    """Yield the items of the array stored under `key` in a top-level JSON object.
+
+    Only one item (plus one read buffer) is held in memory at a time. Values of
+    other keys are parsed and discarded.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        reader = _Reader(f, read_size)
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            name = reader.value(decoder)
+            reader.expect(":")
+            if name == key and reader.peek() == "[":
+                reader.expect("[")
+                if reader.peek() == "]":
+                    reader.pos += 1
+                else:
+                    while True:
+                        yield reader.value(decoder)
+                        if reader.peek() == ",":
+                            reader.pos += 1
+                            continue
+                        reader.expect("]")
+                        break
+            else:
+                reader.value(decoder)
+            if reader.peek() == ",":
+                reader.pos += 1
+                continue
+            reader.expect("}")
+            return
+
+
+def iter_ndjson(path: Path) -> Iterator[Any]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def find_records_file(base_path: Path, stem: str) -> Path | None:
+    """Prefer <stem>.ndjson (one record per line) over <stem>.json."""
+    for suffix in (".ndjson", ".jsonl", ".json"):
+        path = base_path / f"{stem}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def iter_records(path: Path, key: str) -> Iterator[Any]:
+    """Stream records from an NDJSON file or from the `key` array of a JSON file."""
+    if path.suffix in (".ndjson", ".jsonl"):
+        return iter_ndjson(path)
+    return iter_json_array(path, key)
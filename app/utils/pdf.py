@@ -0,0 +1,94 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import pdfplumber
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_worker_count() -> int:
+    configured = int(os.getenv("PDF_EXTRACT_WORKERS", "0"))
+    return configured if configured > 0 else (os.cpu_count() or 1)
+
+
+def get_chunk_pages() -> int:
+    return max(1, int(os.getenv("PDF_EXTRACT_CHUNK_PAGES", "16")))
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Not fork: the parent runs the event loop, asyncpg and other threads whose locks a fork would copy
+        _pool = ProcessPoolExecutor(max_workers=get_worker_count(), mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pdf_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def count_pages(path: Path) -> int:
+    with pdfplumber.open(str(path)) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_range(path: Path, start: int, end: int) -> list[str]:
+    """Extract text of pages [start, end) (0-based). Runs inside a pool worker."""
+    with pdfplumber.open(str(path), pages=list(range(start + 1, end + 1))) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
+
+async def iter_page_texts(path: Path) -> AsyncIterator[tuple[int, str]]:
+    """Yield (page_index, text) for every page of the PDF in page order, including blank pages.
+
+    Pages are extracted in chunks of PDF_EXTRACT_CHUNK_PAGES across the process
+    pool; a chunk is yielded as soon as all preceding chunks are done.
+    """
+    page_count = await asyncio.to_thread(count_pages, path)
+    chunk = get_chunk_pages()
+    ranges = [(start, min(start + chunk, page_count)) for start in range(0, page_count, chunk)]
+    if not ranges:
+        return
+
+    if len(ranges) == 1 or get_worker_count() == 1:
+        # Not worth the process round-trip
+        for start, end in ranges:
+            texts = await asyncio.to_thread(extract_page_range, path, start, end)
+            for offset, text in enumerate(texts):
+                yield start + offset, text
+        return
+
+    loop = asyncio.get_running_loop()
+    pool = get_pdf_pool()
+
+    async def _run(start: int, end: int) -> tuple[int, list[str]]:
+        return start, await loop.run_in_executor(pool, extract_page_range, path, start, end)
+
+    tasks = [asyncio.ensure_future(_run(start, end)) for start, end in ranges]
+    done_chunks: dict[int, list[str]] = {}
+    next_start = 0
+    try:
+        for fut in asyncio.as_completed(tasks):
+            start, texts = await fut
+            done_chunks[start] = texts
+            while next_start in done_chunks:
+                texts = done_chunks.pop(next_start)
+                for offset, text in enumerate(texts):
+                    yield next_start + offset, text
+                next_start += len(texts)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def extract_page_texts(path: Path) -> list[str]:
+    """Return the text of every page (blank pages as empty strings) in page order."""
+    return [text async for _, text in iter_page_texts(path)]
@@ -0,0 +1,190 @@
+"""Job worker: leases jobs from the ingest_job table and runs them.
+
+Run dedicated workers with `python -m app.worker` (any number, on any node
+sharing the database and the data/ directory). The API process runs an
+embedded worker as well unless JOB_EMBEDDED_WORKER=0. With METRICS_PORT set,
+a dedicated worker serves its metrics on that port.
+"""
+import asyncio
+import logging
+import os
+import random
+import signal
+import socket
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict
+
+from .db import SessionLocal
+from .jobs import claim_job, complete_job, fail_expired_jobs, fail_job, get_lease_seconds, progress_callback_factory, renew_lease, update_job
+from .llm import close_llm_scheduler
+from .metrics import render
+from .models import IngestJob
+from .services import delete_offer, ingest_from_pdf
+from .uploads import discard_staged, sweep_incoming
+
+logger = logging.getLogger("uvicorn.error")
+
+JobHandler = Callable[[IngestJob, Callable[[str, int, str], None]], Awaitable[Dict[str, Any]]]
+
+
+async def _run_ingest_pdf(job: IngestJob, progress_cb: Callable[[str, int, str], None]) -> Dict[str, Any]:
+    pdf_path = Path(job.payload["pdf_path"])
+    async with SessionLocal() as session:
+        inserted = await ingest_from_pdf(
+            session,
+            offer_name=job.payload["offer_name"],
+            pdf_path=pdf_path,
+            pdf_sha256=job.payload.get("pdf_sha256"),
+            progress_cb=progress_cb,
+            priority=job.priority,
+        )
+    # data/uploads/<offer>.pdf is a hard link to the staged file; drop the staged name
+    pdf_path.unlink(missing_ok=True)
+    return {"inserted": inserted}
+
+
+async def _run_delete_offer(job: IngestJob, progress_cb: Callable[[str, int, str], None]) -> Dict[str, Any]:
+    return {"deleted": await delete_offer(job.payload["offer_id"], progress_cb=progress_cb)}
+
+
+HANDLERS: Dict[str, JobHandler] = {
+    "ingest_pdf": _run_ingest_pdf,
+    "delete_offer": _run_delete_offer,
+}
+
+
+def _discard_job_files(job: IngestJob) -> None:
+    """Remove what a job left on disk once it has failed for good."""
+    if job.kind == "ingest_pdf":
+        discard_staged(job.payload or {})
+
+
+def _retry_delay(attempt: int) -> float:
+    base = float(os.getenv("JOB_RETRY_BASE_SECONDS", "10"))
+    return base * (2 ** max(0, attempt - 1)) * random.uniform(0.5, 1.5)
+
+
+class Worker:
+    def __init__(self, concurrency: int | None = None, poll_interval: float | None = None) -> None:
+        self.concurrency = max(1, concurrency or int(os.getenv("JOB_WORKER_CONCURRENCY", "2")))
+        self.poll_interval = poll_interval or float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running: Dict[str, asyncio.Task] = {}
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def run(self) -> None:
+        logger.info(f"Worker {self.worker_id} started (concurrency={self.concurrency})")
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while not self._stopping.is_set():
+                job = None
+                if len(self._running) < self.concurrency:
+                    try:
+                        job = await claim_job(self.worker_id, list(HANDLERS))
+                    except Exception:
+                        logger.exception("Claiming a job failed")
+                if job is not None:
+                    self._running[job.id] = asyncio.create_task(self._execute(job))
+                    continue
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            heartbeat.cancel()
+            # Running jobs keep their lease and are picked up again once it expires
+            tasks = list(self._running.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info(f"Worker {self.worker_id} stopped")
+
+    async def _execute(self, job: IngestJob) -> None:
+        try:
+            logger.info(f"Running job {job.id} ({job.kind}, attempt {job.attempts}/{job.max_attempts})")
+            await update_job(job.id, worker_id=self.worker_id, stage="start", progress=1, message="Starting")
+            result = await HANDLERS[job.kind](job, progress_callback_factory(job.id, self.worker_id))
+            if not await complete_job(job.id, self.worker_id, result):
+                logger.warning(f"Job {job.id} finished after its lease was lost, result discarded")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            status = await fail_job(job.id, self.worker_id, str(e), _retry_delay(job.attempts))
+            if status == "pending":
+                logger.info(f"Job {job.id} will be retried")
+            elif status == "failed":
+                _discard_job_files(job)
+            else:
+                logger.warning(f"Job {job.id} failed after its lease was lost, left to its new owner")
+        finally:
+            self._running.pop(job.id, None)
+
+    async def _heartbeat(self) -> None:
+        interval = get_lease_seconds() / 3
+        sweep_interval = float(os.getenv("UPLOAD_SWEEP_INTERVAL_SECONDS", "3600"))
+        last_sweep = float("-inf")
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                for job in await fail_expired_jobs():
+                    _discard_job_files(job)
+                for job_id, task in list(self._running.items()):
+                    if not await renew_lease(job_id, self.worker_id):
+                        logger.warning(f"Lost lease on job {job_id}, cancelling")
+                        task.cancel()
+                if time.monotonic() - last_sweep >= sweep_interval:
+                    last_sweep = time.monotonic()
+                    await sweep_incoming()
+            except Exception:
+                logger.exception("Job heartbeat failed")
+
+
+async def serve_metrics(port: int) -> asyncio.AbstractServer:
+    """Minimal HTTP server answering every request with the metrics text."""
+
+    async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = render().encode("utf-8")
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii")
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(_handle, host="0.0.0.0", port=port)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    worker = Worker()
+
+    async def _main() -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        metrics_port = int(os.getenv("METRICS_PORT", "0"))
+        server = await serve_metrics(metrics_port) if metrics_port else None
+        try:
+            await worker.run()
+        finally:
+            if server:
+                server.close()
+            await close_llm_scheduler()
+
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()
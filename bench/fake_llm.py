@@ -0,0 +1,165 @@
+"""Deterministic stand-in for the OpenAI Responses API, for benchmarks.
+
+Answers the group, variant and component prompts of app.utils.extraction by
+parsing the text layout written by bench.fixtures, after a fixed delay, so an
+ingest exercises the real client, scheduler and pipeline without an API key.
+Usage numbers are computed the same way as app.llm.count_tokens.
+
+    python -m bench.fake_llm --port 8799 --latency 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8799/v1 OPENAI_API_KEY=x uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import re
+import socket
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+PAGE_RE = re.compile(r"^\s*Seite:\s*(\d+)\s*$")
+GROUP_RE = re.compile(r"^\s*Gruppe (\d\d\.\d\d) (.+?)\s*$")
+VARIANT_RE = re.compile(r"^\s*Pos (\S+) (.+?)\s*$")
+PROMPT_GROUP_RE = re.compile(r"for the product group (\d\d\.\d\d) ")
+COMPONENT_VARIANT_RE = re.compile(r"^\s*(\d\d\.\d\d\.\d+): .*? text: (.*)$", re.M)
+COMPONENT_CODE_RE = re.compile(r"\bK-\d+\b")
+
+
+def _input_lines(prompt: str) -> list[str]:
+    return prompt.split("Input:", 1)[-1].splitlines()
+
+
+def _groups(prompt: str) -> dict[str, Any]:
+    groups: dict[str, dict[str, Any]] = {}
+    current = None
+    page = None
+    for line in _input_lines(prompt):
+        if m := PAGE_RE.match(line):
+            page = int(m.group(1))
+        elif m := GROUP_RE.match(line):
+            # Overlapping page windows see a group twice; the first sighting wins
+            current = groups.setdefault(m.group(1), {"group_no": m.group(1), "title": m.group(2), "page_from": page, "page_to": page})
+        elif current and line.strip():
+            current["page_to"] = max(current["page_to"] or 0, page or 0) or None
+    return {"groups": list(groups.values())}
+
+
+def _variants(prompt: str) -> dict[str, Any]:
+    m = PROMPT_GROUP_RE.search(prompt)
+    group_no = m.group(1) if m else ""
+    variants: list[dict[str, Any]] = []
+    current = None
+    page = None
+    for line in _input_lines(prompt):
+        if m := PAGE_RE.match(line):
+            page = int(m.group(1))
+        elif m := VARIANT_RE.match(line):
+            current = None
+            # The sliced text runs into the next group's first page
+            if m.group(1).startswith(group_no + ".") and all(v["variant_no"] != m.group(1) for v in variants):
+                current = {"variant_no": m.group(1), "title": m.group(2), "page_from": page, "page_to": page, "text": ""}
+                variants.append(current)
+        elif GROUP_RE.match(line):
+            current = None
+        elif current and line.strip():
+            current["text"] = f"{current['text']} {line.strip()}".strip()
+    return {"variants": variants}
+
+
+def _components(prompt: str) -> dict[str, Any]:
+    components: dict[str, list[str]] = {}
+    for var_no, text in COMPONENT_VARIANT_RE.findall(prompt.split("Product variants:", 1)[-1]):
+        for code in COMPONENT_CODE_RE.findall(text):
+            components.setdefault(f"Bauteil {code}", []).append(var_no)
+    return {"components": [{"component_description": d, "variant_nos": vnos} for d, vnos in components.items()]}
+
+
+def answer(prompt: str) -> dict[str, Any]:
+    """The JSON payload a perfect model would return for an extraction prompt."""
+    if "Extract the Product Groups" in prompt:
+        return _groups(prompt)
+    if "Extract the Product Variants" in prompt:
+        return _variants(prompt)
+    if "Extract the required components" in prompt:
+        return _components(prompt)
+    return {}
+
+
+def create_app(latency: float = 0.05) -> FastAPI:
+    api = FastAPI()
+    api.state.requests = 0
+
+    @api.get("/v1/models")
+    async def models() -> dict[str, Any]:
+        return {"object": "list", "data": [{"id": "gpt-5", "object": "model", "created": 0, "owned_by": "bench"}]}
+
+    @api.post("/v1/responses")
+    async def responses(request: Request) -> dict[str, Any]:
+        body = await request.json()
+        prompt = body["input"] if isinstance(body["input"], str) else json.dumps(body["input"])
+        api.state.requests += 1
+        if latency > 0:
+            await asyncio.sleep(latency)
+        text = json.dumps(answer(prompt), ensure_ascii=False)
+        input_tokens, output_tokens = len(prompt) // 4, len(text) // 4
+        return {
+            "id": f"resp_{api.state.requests}",
+            "object": "response",
+            "created_at": 0,
+            "model": body.get("model", "gpt-5"),
+            "status": "completed",
+            "output": [{
+                "type": "message",
+                "id": f"msg_{api.state.requests}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "parallel_tool_calls": False,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens_details": {"reasoning_tokens": 0},
+            },
+        }
+
+    return api
+
+
+@asynccontextmanager
+async def running_fake_llm(latency: float = 0.05) -> AsyncIterator[str]:
+    """Serve the fake on a free local port for the duration of the block; yields its base URL."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(create_app(latency), log_level="warning", lifespan="off"))
+    task = asyncio.create_task(server.serve(sockets=[sock]))
+    try:
+        while not server.started:
+            if task.done():
+                task.result()
+            await asyncio.sleep(0.01)
+        yield f"http://127.0.0.1:{port}/v1"
+    finally:
+        server.should_exit = True
+        await task
+        sock.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per response")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
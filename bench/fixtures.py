@@ -0,0 +1,128 @@
+"""Synthetic LV documents of configurable size, as JSON fixtures and as PDFs.
+
+Both formats are rendered from the same `SyntheticLV`, so a JSON import and a
+PDF ingest (against bench.fake_llm) produce the same groups, variants and
+components. Everything is derived from the sizes and a seed string, so the
+same arguments always give byte-identical files.
+
+Page layout of the PDF, which bench.fake_llm parses back:
+
+    Seite: 3
+    Gruppe 01.02 Fenster Serie 2
+    Pos 01.02.0010 Fenster Typ 1 1000x1200 mm
+      Lieferung und Montage ... (long text)
+      Bauteile: K-0004, K-0017
+"""
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+LINES_PER_PAGE = 60
+
+
+@dataclass
+class SyntheticLV:
+    groups: list[dict[str, Any]] = field(default_factory=list)
+    variants: list[dict[str, Any]] = field(default_factory=list)
+    # component description -> variant numbers
+    components: dict[str, list[str]] = field(default_factory=dict)
+    pages: list[list[str]] = field(default_factory=list)
+
+
+def component_description(code: str) -> str:
+    return f"Bauteil {code}"
+
+
+def _group_no(g: int) -> str:
+    return f"{(g - 1) // 99 + 1:02d}.{(g - 1) % 99 + 1:02d}"
+
+
+def build_lv(groups: int, variants: int, components: int, component_pool: int = 0, seed: str = "") -> SyntheticLV:
+    """Lay out `groups` × `variants` positions, each requiring `components` parts
+    picked from a pool shared by the whole document (default: groups × components)."""
+    lv = SyntheticLV()
+    pool = max(components, component_pool or groups * components, 1)
+    lines: list[str] = []
+
+    def new_page() -> None:
+        if lines:
+            lv.pages.append(lines.copy())
+            lines.clear()
+        lines.append(f"Seite: {len(lv.pages) + 1}")
+
+    new_page()
+    if seed:
+        lines.append(f"Leistungsverzeichnis {seed}")
+    for g in range(1, groups + 1):
+        group_no = _group_no(g)
+        # Every group starts on a new page
+        if len(lines) > 2:
+            new_page()
+        page_from = len(lv.pages) + 1
+        title = f"Fenster Serie {g}"
+        lines.append(f"Gruppe {group_no} {title}")
+        for v in range(1, variants + 1):
+            var_no = f"{group_no}.{v * 10:04d}"
+            short_text = f"Fenster Typ {v} {1000 + 10 * v}x{1200 + 10 * g} mm"
+            codes = sorted({f"K-{(g * 7919 + v * 104729 + k * 31) % pool:04d}" for k in range(components)})
+            long_text = (
+                f"Lieferung und Montage Fenster Typ {v}, Kunststoff, Dreifachverglasung, "
+                f"Uw-Wert 0,{80 + v % 20} W/m2K, inkl. Beschlag und Abdichtung."
+            )
+            if len(lines) + 4 > LINES_PER_PAGE:
+                new_page()
+            lines.append(f"Pos {var_no} {short_text}")
+            lines.append(f"  {long_text}")
+            if codes:
+                lines.append(f"  Bauteile: {', '.join(codes)}")
+            lv.variants.append({
+                "variant_no": var_no,
+                "title": short_text,
+                "text": long_text + (f" Bauteile: {', '.join(codes)}" if codes else ""),
+                "page_from": len(lv.pages) + 1,
+                "page_to": len(lv.pages) + 1,
+            })
+            for code in codes:
+                lv.components.setdefault(component_description(code), []).append(var_no)
+        lv.groups.append({"group_no": group_no, "title": title, "page_from": page_from, "page_to": len(lv.pages) + 1})
+    lv.pages.append(lines.copy())
+    return lv
+
+
+def write_json_fixtures(lv: SyntheticLV, base_dir: Path) -> Path:
+    """Write product_groups.json, product_variants.json and required_components.json for ingest_from_json."""
+    base_dir.mkdir(parents=True, exist_ok=True)
+    (base_dir / "product_groups.json").write_text(json.dumps({"groups": lv.groups}, ensure_ascii=False), encoding="utf-8")
+    (base_dir / "product_variants.json").write_text(json.dumps({"variants": lv.variants}, ensure_ascii=False), encoding="utf-8")
+    components = [{"component_description": d, "variant_nos": vnos} for d, vnos in lv.components.items()]
+    (base_dir / "required_components.json").write_text(json.dumps({"components": components}, ensure_ascii=False), encoding="utf-8")
+    return base_dir
+
+
+def _pdf_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(lv: SyntheticLV, path: Path) -> Path:
+    """Write the pages as a plain PDF (Helvetica text, one object per page and content stream)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(len(lv.pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(lv.pages)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    for i, lines in enumerate(lv.pages):
+        content = ("BT /F1 9 Tf 12 TL 40 810 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET").encode("cp1252")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        objects.append(b"<< /Length " + str(len(content)).encode() + b" >>\nstream\n" + content + b"\nendstream")
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(bytes(out))
+    return path
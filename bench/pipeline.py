@@ -0,0 +1,256 @@
+"""Benchmark of JSON import, PDF ingestion, the offer detail page and the Excel export.
+
+Generates a synthetic LV of the given size (bench.fixtures), ingests it with
+ingest_from_json and, against the deterministic fake LLM (bench.fake_llm),
+with ingest_from_pdf, then loads and exports the imported offer. Each
+scenario runs once with tracemalloc for its peak Python memory, then
+--repeat times for p50/p95 latency and throughput. Every PDF run gets its own
+document, so text extraction and LLM calls are never served from a cache.
+Offers created by the run are deleted again.
+
+    python -m bench.pipeline --groups 20 --variants 25 --components 3 --output bench/results/main.json
+    python -m bench.pipeline --groups 20 --variants 25 --components 3 --compare bench/results/main.json
+
+With --compare the run exits with status 1 if p50, p95 or peak memory of a
+scenario grew by more than --threshold (default 20%) over the baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import select, text
+
+from app.db import SessionLocal, engine
+from app.llm import close_llm_scheduler
+from app.migrations import run_migrations
+from app.models import Offer
+from app.services import delete_offer, export_offer_to_excel, ingest_from_json, ingest_from_pdf, load_offer_detail
+from app.uploads import UPLOAD_DIR
+from app.utils.pdf import shutdown_pdf_pool
+from bench.fake_llm import running_fake_llm
+from bench.fixtures import build_lv, write_json_fixtures, write_pdf
+from bench.queries import percentile
+
+SCENARIOS = ("ingest_json", "ingest_pdf", "offer_detail", "export_xlsx")
+# Compared against the baseline; all of them are "lower is better"
+COMPARED = ("p50_ms", "p95_ms", "peak_mb")
+
+
+def _max_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    rss = resource.getrusage(who).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+async def measure(name: str, run_once: Callable[[int], Awaitable[int]], repeat: int, unit: str) -> dict[str, Any]:
+    """Run `run_once(i)` once traced and `repeat` times timed; it returns the number of units processed."""
+    tracemalloc.start()
+    try:
+        await run_once(0)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    timings: list[float] = []
+    units = 0
+    for i in range(1, repeat + 1):
+        start = time.perf_counter()
+        units += await run_once(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "name": name,
+        "runs": repeat,
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "mean_ms": round(statistics.fmean(timings), 2),
+        "throughput": round(units / (sum(timings) / 1000), 1),
+        "unit": f"{unit}/s",
+        "peak_mb": round(peak / (1024 * 1024), 2),
+        # High-water mark of the whole process so far, so it only grows from scenario to scenario
+        "max_rss_mb": _max_rss_mb(),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    await run_migrations()
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+    workdir = Path(tempfile.mkdtemp(prefix="lvflow-bench-"))
+    # No response cache, no stored texts from earlier runs and no quotas: every run does the full work
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+    os.environ["TEXT_STORE_DIR"] = str(workdir / "texts")
+    os.environ["LLM_RPM"] = "0"
+    os.environ["LLM_TPM"] = "0"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+    lv = build_lv(args.groups, args.variants, args.components)
+    json_dir = write_json_fixtures(lv, workdir / "json")
+    expected = {"groups": len(lv.groups), "variants": len(lv.variants)}
+    print(f"Synthetic LV: {len(lv.groups)} groups, {len(lv.variants)} variants, {len(lv.components)} components, {len(lv.pages)} pages")
+
+    async def ingest_json_once(i: int) -> int:
+        async with SessionLocal() as session:
+            result = await ingest_from_json(session, f"{prefix}json-{i}", str(json_dir))
+        return result["variants"]
+
+    # One document per run, differing only in a header line, so its hash (and stored text) is new every time
+    pdf_paths = [
+        write_pdf(build_lv(args.groups, args.variants, args.components, seed=f"{prefix}{i}"), workdir / f"lv-{i}.pdf")
+        for i in range(args.repeat + 1)
+    ] if "ingest_pdf" in args.only else []
+
+    async def ingest_pdf_once(i: int) -> int:
+        async with SessionLocal() as session:
+            result = await ingest_from_pdf(session, f"{prefix}pdf-{i}", pdf_paths[i])
+        got = {"groups": result["groups"], "variants": result["variants"]}
+        if got != expected or result["failed_groups"]:
+            raise RuntimeError(f"PDF ingest returned {got} (failed groups: {result['failed_groups']}), expected {expected}")
+        return result["variants"]
+
+    offer_id = 0
+
+    async def offer_detail_once(i: int) -> int:
+        async with SessionLocal() as session:
+            groups = await load_offer_detail(session, offer_id)
+        return sum(len(g["variants"]) for g in groups)
+
+    async def export_once(i: int) -> int:
+        async with SessionLocal() as session:
+            await export_offer_to_excel(offer_id, session)
+        return len(lv.variants)
+
+    results: list[dict[str, Any]] = []
+    try:
+        async with running_fake_llm(args.llm_latency) as base_url:
+            os.environ["OPENAI_BASE_URL"] = base_url
+            scenarios = [
+                ("ingest_json", ingest_json_once, "variants"),
+                ("ingest_pdf", ingest_pdf_once, "variants"),
+                ("offer_detail", offer_detail_once, "variants"),
+                ("export_xlsx", export_once, "rows"),
+            ]
+            for name, run_once, unit in scenarios:
+                if name not in args.only:
+                    continue
+                if name in ("offer_detail", "export_xlsx") and not offer_id:
+                    async with SessionLocal() as session:
+                        await ingest_from_json(session, f"{prefix}read", str(json_dir))
+                        offer_id = (await session.execute(select(Offer.id).where(Offer.doc_name == f"{prefix}read"))).scalar_one()
+                print(f"Running {name} ...", flush=True)
+                results.append(await measure(name, run_once, args.repeat, unit))
+        async with engine.connect() as conn:
+            server_version = (await conn.execute(text("SHOW server_version"))).scalar_one()
+    finally:
+        async with SessionLocal() as session:
+            offer_ids = (await session.execute(select(Offer.id).where(Offer.doc_name.like(f"{prefix}%")))).scalars().all()
+        for bench_offer_id in offer_ids:
+            await delete_offer(bench_offer_id)
+        for kept in UPLOAD_DIR.glob(f"{prefix}*.pdf"):
+            kept.unlink()
+        await close_llm_scheduler()
+        shutdown_pdf_pool()
+        await engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "postgres": server_version,
+            "cpus": os.cpu_count(),
+            # PDF extraction runs in worker processes, which max_rss_mb of the scenarios leaves out
+            "pdf_workers_max_rss_mb": _max_rss_mb(resource.RUSAGE_CHILDREN),
+        },
+        "params": {
+            "groups": args.groups,
+            "variants": args.variants,
+            "components": args.components,
+            "repeat": args.repeat,
+            "llm_latency": args.llm_latency,
+            "llm_max_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        },
+        "results": results,
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(f"\n{'scenario':<14}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'throughput':>22}{'peak MB':>10}{'RSS MB':>9}")
+    for r in report["results"]:
+        print(
+            f"{r['name']:<14}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['mean_ms']:>10.1f}"
+            f"{r['throughput']:>12.1f} {r['unit']:<9}{r['peak_mb']:>10.2f}{r['max_rss_mb']:>9.1f}"
+        )
+
+
+def compare(report: dict[str, Any], baseline: dict[str, Any], threshold: float) -> list[str]:
+    """Print the change of every compared metric against the baseline and return the regressions."""
+    if report["params"] != baseline["params"]:
+        print(f"\nWarning: parameters differ from the baseline ({baseline['params']}), the comparison is not like for like")
+    before = {r["name"]: r for r in baseline["results"]}
+    regressions: list[str] = []
+    print(f"\nAgainst baseline {baseline['meta'].get('commit') or '?'} from {baseline['meta'].get('created', '?')} (threshold {threshold:.0%}):")
+    print(f"{'scenario':<14}{'metric':<10}{'baseline':>12}{'current':>12}{'change':>10}")
+    for r in report["results"]:
+        old = before.get(r["name"])
+        if old is None:
+            continue
+        for metric in COMPARED:
+            if not old.get(metric):
+                continue
+            change = r[metric] / old[metric] - 1
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{r['name']} {metric} {change:+.0%}")
+            print(f"{r['name']:<14}{metric:<10}{old[metric]:>12.2f}{r[metric]:>12.2f}{change:>+10.0%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--variants", type=int, default=25, help="variants per group")
+    parser.add_argument("--components", type=int, default=3, help="components per variant")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per scenario")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds the fake LLM takes per request")
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, default=list(SCENARIOS), help="scenarios to run")
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--compare", type=Path, help="results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative growth before a metric counts as regressed")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text(encoding="utf-8")), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): " + ", ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
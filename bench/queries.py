@@ -0,0 +1,148 @@
+"""Query benchmark for the offer detail page, the export and offer deletion.
+
+Seeds synthetic offers into the database configured by DATABASE_URL, then
+prints the EXPLAIN (ANALYZE, BUFFERS) plan and p50/p95 latencies of every
+query against an offer from the middle of the seeded range. Seeded offers are
+named "bench-<run>-<n>" and removed again unless --keep is given.
+
+    python -m bench.queries --offers 500 --groups 10 --variants 20 --components 3
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from typing import Any
+
+from sqlalchemy import Select, delete, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.db import engine
+from app.migrations import run_migrations
+from app.models import Offer
+from app.services import offer_detail_queries, offer_export_query
+
+
+async def seed(conn: AsyncConnection, prefix: str, offers: int, groups: int, variants: int, components: int) -> None:
+    """Insert offers × groups × variants, each variant linked to `components` components out of a shared pool."""
+    params = {"prefix": prefix, "offers": offers, "groups": groups, "variants": variants, "components": components}
+    await conn.execute(text("INSERT INTO offer (doc_name) SELECT :prefix || n FROM generate_series(1, CAST(:offers AS integer)) n"), params)
+    await conn.execute(text(
+        "INSERT INTO prod_group (offer_id, group_nr, title, page_from, page_to) "
+        "SELECT o.id, lpad(g::text, 4, '0'), 'Gruppe ' || g, g * 2 - 1, g * 2 "
+        "FROM offer o, generate_series(1, CAST(:groups AS integer)) g WHERE o.doc_name LIKE :prefix || '%'"
+    ), params)
+    await conn.execute(text(
+        "INSERT INTO prod_variant (group_id, var_nr, short_text, long_text) "
+        "SELECT g.id, g.group_nr || '.' || v, 'Variante ' || v, repeat('Lieferung und Montage ', 20) || g.id || '.' || v "
+        "FROM prod_group g JOIN offer o ON o.id = g.offer_id, generate_series(1, CAST(:variants AS integer)) v "
+        "WHERE o.doc_name LIKE :prefix || '%'"
+    ), params)
+    # A pool of components shared across offers, like real catalogue parts
+    await conn.execute(text(
+        "INSERT INTO component (description, description_norm) "
+        "SELECT :prefix || 'Bauteil ' || n, lower(:prefix || 'bauteil ' || n) "
+        "FROM generate_series(1, greatest(100, CAST(:offers AS integer) * CAST(:groups AS integer))) n"
+    ), params)
+    await conn.execute(text(
+        "WITH pool AS (SELECT min(id) AS lo, count(*) AS n FROM component WHERE description LIKE :prefix || '%') "
+        "INSERT INTO prod_variant_component (prod_variant_id, component_id, count) "
+        "SELECT v.id, pool.lo + (v.id::bigint * 7919 + k * 104729) % pool.n, 1 "
+        "FROM prod_variant v JOIN prod_group g ON g.id = v.group_id JOIN offer o ON o.id = g.offer_id, pool, "
+        "generate_series(1, CAST(:components AS integer)) k "
+        "WHERE o.doc_name LIKE :prefix || '%' ON CONFLICT DO NOTHING"
+    ), params)
+    await conn.execute(text("ANALYZE"))
+
+
+def _sql(stmt: Select) -> str:
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+async def _explain(conn: AsyncConnection, sql: str) -> str:
+    rows = (await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"))).scalars().all()
+    return "\n".join(rows)
+
+
+async def _timings(conn: AsyncConnection, sql: str, repeat: int) -> list[float]:
+    timings: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await conn.execute(text(sql))
+        if result.returns_rows:
+            result.all()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run(args: argparse.Namespace) -> None:
+    await run_migrations()
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+    async with engine.connect() as conn:
+        start = time.perf_counter()
+        await seed(conn, prefix, args.offers, args.groups, args.variants, args.components)
+        await conn.commit()
+        print(f"Seeded {args.offers} offers in {time.perf_counter() - start:.1f}s")
+
+        offer_id = (await conn.execute(
+            select(Offer.id).where(Offer.doc_name == f"{prefix}{max(1, args.offers // 2)}")
+        )).scalar_one()
+        groups_stmt, variants_stmt, links_stmt = offer_detail_queries(offer_id)
+        queries: list[tuple[str, str, bool]] = [
+            ("offer by name", _sql(select(Offer).where(Offer.doc_name == f"{prefix}{args.offers}")), False),
+            ("detail: groups", _sql(groups_stmt), False),
+            ("detail: variants", _sql(variants_stmt), False),
+            ("detail: links", _sql(links_stmt), False),
+            ("export", _sql(offer_export_query(offer_id)), False),
+            # Rolled back after every run, so the same offer is deleted each time
+            ("delete offer", _sql(delete(Offer).where(Offer.id == offer_id)), True),
+        ]
+        results: list[dict[str, Any]] = []
+        for name, sql, rollback in queries:
+            plan = await _explain(conn, sql)
+            if rollback:
+                await conn.rollback()
+                timings = []
+                for _ in range(args.repeat):
+                    timings += await _timings(conn, sql, 1)
+                    await conn.rollback()
+            else:
+                timings = await _timings(conn, sql, args.repeat)
+                await conn.commit()
+            results.append({"name": name, "p50": percentile(timings, 50), "p95": percentile(timings, 95), "mean": statistics.fmean(timings)})
+            if args.plans:
+                print(f"\n== {name}\n{plan}")
+            elif "Seq Scan" in plan:
+                print(f"{name}: plan contains a sequential scan (run with --plans to see it)")
+
+        print(f"\n{'query':<20}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+        for r in results:
+            print(f"{r['name']:<20}{r['p50']:>10.2f}{r['p95']:>10.2f}{r['mean']:>10.2f}")
+
+        if not args.keep:
+            await conn.execute(text("DELETE FROM offer WHERE doc_name LIKE :prefix || '%'"), {"prefix": prefix})
+            await conn.execute(text("DELETE FROM component WHERE description LIKE :prefix || '%'"), {"prefix": prefix})
+            await conn.commit()
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offers", type=int, default=200)
+    parser.add_argument("--groups", type=int, default=10, help="groups per offer")
+    parser.add_argument("--variants", type=int, default=20, help="variants per group")
+    parser.add_argument("--components", type=int, default=3, help="components per variant")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per query")
+    parser.add_argument("--plans", action="store_true", help="print the full EXPLAIN ANALYZE output")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded offers")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()